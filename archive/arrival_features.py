@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+
+import sys
+import argparse
+import collections
+import numpy as np
+from os import path
+sys.path.append(path.join(path.abspath(path.dirname(__file__)), '..'))
+import datalink_log
+
+
+def histogram(values):
+    # (value, occurrence) pairs in increasing order of value
+    values, counts = np.unique(values, return_counts=True)
+    return zip(values.tolist(), counts.tolist())
+
+
+class ArrivalFeatures(collections.namedtuple('ArrivalFeatures', [
+        'arrivals_per_ms', 'arrivals_per_ms_with_silence',
+        'interarrival_times', 'on_off_interval'])):
+    """Arrival statistics of the deliveries of one datalink log.
+
+    arrivals_per_ms counts the deliveries of every ms that has some, and
+    arrivals_per_ms_with_silence also has a 0 for every silent ms in
+    between; like the line-by-line versions they replace, both leave out
+    the last ms, whose count may be cut short by the end of the log.
+    interarrival_times are the gaps between consecutive deliveries and
+    on_off_interval the nonzero ones, i.e. the gaps between ON ms.
+    """
+
+    def histogram(self, name):
+        return histogram(getattr(self, name))
+
+
+class ArrivalStream(object):
+    """Arrival features of deliveries fed a chunk at a time.
+
+    The last ms of a chunk may continue in the next one, so its count is
+    carried over; feed() returns the features of everything up to it.
+    Once every chunk is fed, the features returned add up to those of the
+    whole log, which likewise leave out its last ms.
+    """
+
+    def __init__(self):
+        self.last_ms = None
+        self.last_count = 0
+
+    def feed(self, delivery_ms):
+        # delivery_ms is in log order, i.e. nondecreasing
+        if len(delivery_ms) == 0:
+            empty = np.zeros(0, dtype=np.int64)
+            return ArrivalFeatures(empty, empty, empty, empty)
+
+        if self.last_ms is not None:
+            delivery_ms = np.concatenate([[self.last_ms], delivery_ms])
+
+        # the distinct ms with deliveries and their delivery counts
+        gaps = np.diff(delivery_ms)
+        starts = np.flatnonzero(np.concatenate([[True], gaps != 0]))
+        on_ms = delivery_ms[starts]
+        counts = np.diff(np.append(starts, len(delivery_ms)))
+        counts[0] += self.last_count - (self.last_ms is not None)
+
+        self.last_ms = on_ms[-1]
+        self.last_count = counts[-1]
+
+        with_silence = np.zeros(on_ms[-1] - on_ms[0], dtype=np.int64)
+        with_silence[on_ms[:-1] - on_ms[0]] = counts[:-1]
+
+        return ArrivalFeatures(
+            arrivals_per_ms=counts[:-1],
+            arrivals_per_ms_with_silence=with_silence,
+            interarrival_times=gaps,
+            on_off_interval=np.diff(on_ms))
+
+
+def arrival_features(delivery_ms):
+    return ArrivalStream().feed(delivery_ms)
+
+
+def load_features(log_path):
+    columns = datalink_log.load(log_path, sidecar=True)
+    return arrival_features(datalink_log.delivery_ms(columns))
+
+
+def iter_features(log_path, chunk_bytes=64 * 1024 ** 2):
+    # features of one chunk of the log at a time, in log order
+    stream = ArrivalStream()
+    for columns in datalink_log.iter_chunks(log_path, chunk_bytes):
+        yield stream.feed(datalink_log.delivery_ms(columns))
+
+
+def feature_histograms(log_path, chunk_bytes=64 * 1024 ** 2):
+    """{feature name: Counter of value occurrences} of a log of any size,
+    in memory that does not grow with it."""
+    histograms = dict((name, collections.Counter())
+                      for name in ArrivalFeatures._fields)
+    for features in iter_features(log_path, chunk_bytes):
+        for name, histogram in histograms.iteritems():
+            histogram.update(dict(features.histogram(name)))
+    return histograms
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('log_path', metavar='LOG-PATH')
+    args = parser.parse_args()
+
+    features = load_features(args.log_path)
+
+    print 'Arrivals per ms: (arrivals_per_ms, occurrence)'
+    print features.histogram('arrivals_per_ms')
+    print 'Interarrival times (ms): (interarrival_times, occurrence)'
+    print features.histogram('interarrival_times')
+    print 'Interval between two ON states (ms): (interval, occurrence)'
+    print features.histogram('on_off_interval')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,36 +1,14 @@
 #!/usr/bin/env python
 
+import sys
 import argparse
-import collections
+from os import path
+sys.path.append(path.abspath(path.dirname(__file__)))
+from arrival_features import load_features
 
 
 def get_arrivals_per_ms(log_path):
-    # get arrivals per ms
-    arrivals_per_ms = []
-    pkts = 0
-
-    log = open(log_path)
-
-    last_ts = None
-    for line in log:
-        items = line.split()
-        if len(items) < 4 or items[1] != '-':
-            continue
-
-        ts = int(items[0])
-
-        if ts != last_ts:
-            if last_ts != None:
-                arrivals_per_ms.append(pkts)
-            pkts = 1
-        else:
-            pkts += 1
-
-        last_ts = ts
-
-    log.close()
-
-    return arrivals_per_ms
+    return load_features(log_path).arrivals_per_ms.tolist()
 
 
 if __name__ == '__main__':
@@ -38,8 +16,7 @@ if __name__ == '__main__':
     parser.add_argument('log_path', metavar='LOG-PATH')
     args = parser.parse_args()
 
-    data = get_arrivals_per_ms(args.log_path)
-    data_cnt = collections.Counter(data)
+    features = load_features(args.log_path)
 
     print 'Arrivals per ms: (arrivals_per_ms, occurrence)'
-    print sorted(data_cnt.items(), key=lambda x: x[0])
+    print features.histogram('arrivals_per_ms')
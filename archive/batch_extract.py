@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+from os import path
+
+
+def experiment_logs(data_dir, suffix):
+    """(log_path, trace_path) of every (scheme, run_id) of the pantheon
+    experiment in data_dir; trace_path is the log's path with .log
+    replaced by suffix."""
+    metadata_fname = path.join(data_dir, 'pantheon_metadata.json')
+    with open(metadata_fname) as metadata_file:
+        metadata_dict = json.load(metadata_file)
+
+    run_times = metadata_dict['run_times']
+    cc_schemes = metadata_dict['cc_schemes'].split()
+
+    logs = []
+    for cc in cc_schemes:
+        for run_id in xrange(1, 1 + run_times):
+            prefix = path.join(data_dir, '%s_datalink_run%s' % (cc, run_id))
+            logs.append((prefix + '.log', prefix + suffix))
+    return logs
+
+
+def up_to_date(log_path, trace_path):
+    try:
+        return path.getmtime(trace_path) >= path.getmtime(log_path)
+    except OSError:
+        return False
+
+
+def extract_one(task):
+    extract, log_path, trace_path = task
+
+    # an interrupted extraction must not leave a trace that looks up to date
+    tmp_path = '%s.%d.tmp' % (trace_path, os.getpid())
+    start_ts = time.time()
+    try:
+        extract(log_path, tmp_path)
+        os.rename(tmp_path, trace_path)
+    except:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+    return log_path, path.getsize(log_path), time.time() - start_ts
+
+
+def run_batch(extract, data_dirs, suffix, jobs=None, force=False):
+    """Run extract(log_path, trace_path) over every log of the experiments
+    in data_dirs on a pool of jobs processes, skipping logs whose trace is
+    newer than the log unless force is set."""
+    tasks = []
+    skipped = 0
+    for data_dir in data_dirs:
+        for log_path, trace_path in experiment_logs(data_dir, suffix):
+            if not force and up_to_date(log_path, trace_path):
+                skipped += 1
+                continue
+            tasks.append((extract, log_path, trace_path))
+
+    if skipped:
+        sys.stderr.write('%d traces are up to date\n' % skipped)
+    if not tasks:
+        return
+
+    if jobs is None:
+        jobs = multiprocessing.cpu_count()
+    jobs = max(1, min(jobs, len(tasks)))
+
+    start_ts = time.time()
+    total_bytes = 0
+
+    pool = multiprocessing.Pool(jobs)
+    try:
+        for log_path, size, seconds in pool.imap_unordered(extract_one,
+                                                           tasks):
+            total_bytes += size
+            sys.stderr.write('+ %s: %.1f MB in %.2fs (%.1f MB/s)\n' % (
+                log_path, size / 1e6, seconds,
+                size / 1e6 / max(seconds, 1e-6)))
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+    elapsed = time.time() - start_ts
+    sys.stderr.write('%d logs, %.1f MB in %.2fs (%.1f MB/s), %d jobs\n'
+                     % (len(tasks), total_bytes / 1e6, elapsed,
+                        total_bytes / 1e6 / max(elapsed, 1e-6), jobs))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--data-dir',
+        metavar='DIR',
+        nargs='+',
+        dest='data_dirs',
+        default=['.'],
+        help='directories containing json and logs to extract real traces')
+    parser.add_argument(
+        '-j', '--jobs', type=int,
+        help='processes extracting at once (default: number of cores)')
+    parser.add_argument(
+        '--force', action='store_true',
+        help='extract traces that are newer than their logs too')
+    return parser.parse_args()
@@ -1,51 +1,35 @@
 #!/usr/bin/env python
 
-import json
-import argparse
+import sys
+import numpy as np
 from os import path
+sys.path.append(path.join(path.abspath(path.dirname(__file__)), '..'))
+sys.path.append(path.abspath(path.dirname(__file__)))
+import datalink_log
+from datalink_log import DEPARTURE
+from batch_extract import parse_args, run_batch
+
+
+def extract(log_path, trace_path):
+    first_ts = None
+
+    with open(trace_path, 'w', 1 << 20) as trace:
+        for columns in datalink_log.iter_chunks(log_path):
+            # timestamps are positive, so this rounds halves up like round()
+            ts = np.floor(columns.ts[columns.event == DEPARTURE] + 0.5)
+            ts = ts.astype(np.int64)
+            if not len(ts):
+                continue
+
+            if first_ts is None:
+                first_ts = ts[0] - 1
+            trace.write('\n'.join(map(str, (ts - first_ts).tolist())))
+            trace.write('\n')
 
 
 def main():
-    parser = argparse.ArgumentParser()
-    parser.add_argument(
-        '--data-dir',
-        metavar='DIR',
-        action='store',
-        dest='data_dir',
-        default='.',
-        help='directory containing json and logs to extract real traces')
-    args = parser.parse_args()
-    data_dir = path.abspath(args.data_dir)
-
-    # load pantheon_metadata.json as a dictionary
-    metadata_fname = path.join(data_dir, 'pantheon_metadata.json')
-    with open(metadata_fname) as metadata_file:
-        metadata_dict = json.load(metadata_file)
-
-    run_times = metadata_dict['run_times']
-    cc_schemes = metadata_dict['cc_schemes'].split()
-
-    for cc in cc_schemes:
-        for run_id in xrange(1, 1 + run_times):
-            log_path = path.join(args.data_dir,
-                                 '%s_datalink_run%s.log' % (cc, run_id))
-            trace_path = path.join(args.data_dir,
-                                   '%s_datalink_run%s.trace' % (cc, run_id))
-            log = open(log_path)
-            trace = open(trace_path, 'w')
-
-            first_ts = None
-            for line in log:
-                items = line.split()
-                if items[1] == '-':
-                    ts = int(round(float(items[0])))
-                    if first_ts is None:
-                        first_ts = ts - 1
-
-                    trace.write('%s\n' % (ts - first_ts))
-
-            log.close()
-            trace.close()
+    args = parse_args()
+    run_batch(extract, args.data_dirs, '.trace', args.jobs, args.force)
 
 
 if __name__ == '__main__':
@@ -1,106 +1,201 @@
 #!/usr/bin/env python
 
 import sys
-import json
-import argparse
+import numpy as np
 from os import path
-from collections import deque
+sys.path.append(path.join(path.abspath(path.dirname(__file__)), '..'))
+sys.path.append(path.abspath(path.dirname(__file__)))
+import datalink_log
+from datalink_log import ARRIVAL, DEPARTURE
+from batch_extract import parse_args, run_batch
+
+# a delivery matches an enqueued packet sent within this many ms of it
+tolerance = 0.005
+
+# lines per write of the loss trace
+write_lines_per_call = 65536
+
+# ms within which the link delivers a packet or never does
+horizon = 60000
+
+
+def match_bounds(queue, sent):
+    """[lo, hi) ranges of queue indices with abs(sent - queue) <= tolerance
+    for every sent time, found with exactly that float comparison."""
+    lo = np.searchsorted(queue, sent - 2 * tolerance)
+    hi = np.searchsorted(queue, sent + 2 * tolerance, 'right')
+
+    # the widened ranges hold at most a few distinct values on either side
+    # that fail the exact test; skip them one distinct value at a time
+    while True:
+        fix = lo < hi
+        fix[fix] = ~(np.abs(sent[fix] - queue[lo[fix]]) <= tolerance)
+        if not fix.any():
+            break
+        lo[fix] = np.searchsorted(queue, queue[lo[fix]], 'right')
+
+    while True:
+        fix = lo < hi
+        fix[fix] = ~(np.abs(sent[fix] - queue[hi[fix] - 1]) <= tolerance)
+        if not fix.any():
+            break
+        hi[fix] = np.searchsorted(queue, queue[hi[fix] - 1], 'left')
+
+    return lo, hi
+
+
+def match(queue, sent, logged):
+    """Mask of the enqueue times in queue that no delivery takes.
+
+    Each delivery, in log order, takes the earliest enqueued packet logged
+    before it (the first logged[k] of queue) that is not taken yet and was
+    sent within tolerance of sent[k], its timestamp minus its delay.
+    Enqueue times grow along the log, so the candidates of a delivery are
+    a contiguous range of queue, found by binary search; a union-find over
+    taken packets then jumps to the first free one of the range in near
+    constant time.
+    """
+    if np.any(np.diff(queue) < 0):
+        raise ValueError('enqueue timestamps are not in log order')
+
+    lo, hi = match_bounds(queue, sent)
+    hi = np.minimum(hi, logged)
+
+    # next_free[i] leads to the first packet at or after i not taken yet;
+    # len(queue) stands for none
+    next_free = range(len(queue) + 1)
+    unmatched = np.ones(len(queue), dtype=bool)
+
+    for first, end in zip(lo.tolist(), hi.tolist()):
+        if first >= end:
+            continue
+
+        i = first
+        while next_free[i] != i:
+            i = next_free[i]
+        while next_free[first] != i:
+            next_free[first], first = i, next_free[first]
+
+        if i < end:
+            unmatched[i] = False
+            next_free[i] = i + 1
+
+    return unmatched
+
+
+def unmatched_arrivals(columns):
+    # mask of the enqueued packets of a whole log that are never delivered
+    arrivals = columns.event == ARRIVAL
+    departures = columns.event == DEPARTURE
+
+    sent = columns.ts[departures] - columns.delay[departures]
+    return match(columns.ts[arrivals], sent, np.cumsum(arrivals)[departures])
+
+
+def merge(delivered, lost):
+    """Timestamps (rounded ms) of the lines of a loss trace, with a mask of
+    the lost ones: deliveries and never delivered packets merged by time,
+    a delivery going first on ties."""
+    ts = np.concatenate([delivered, lost])
+    is_lost = np.concatenate([np.zeros(len(delivered), dtype=bool),
+                              np.ones(len(lost), dtype=bool)])
+    order = np.lexsort((is_lost, ts))
+
+    # timestamps are positive, so this rounds halves up like round()
+    ts = np.floor(ts[order] + 0.5).astype(np.int64)
+    return ts, is_lost[order]
+
+
+class LossStream(object):
+    """Loss trace lines of a log fed a chunk at a time.
+
+    Only packets enqueued within horizon ms of the last event fed are
+    kept for later deliveries to take: the link is taken to be a FIFO
+    queue that delivers every packet within horizon ms or never, so that
+    a packet older than that is settled as lost. Deliveries and settled
+    losses are returned as soon as nothing fed later can come before
+    them, which bounds memory by the events of one chunk plus horizon ms.
+
+    A delivery delayed by more than horizon ms may miss its packet, which
+    is then reported lost; such deliveries are counted in late.
+    """
+
+    def __init__(self, horizon=horizon):
+        self.horizon = horizon
+        # packets not taken yet and deliveries not returned yet
+        self.queue = np.zeros(0)
+        self.delivered = np.zeros(0)
+        self.late = 0
+
+    def feed(self, columns):
+        arrivals = columns.event == ARRIVAL
+        departures = columns.event == DEPARTURE
+
+        queue = np.concatenate([self.queue, columns.ts[arrivals]])
+        sent = columns.ts[departures] - columns.delay[departures]
+        logged = len(self.queue) + np.cumsum(arrivals)[departures]
+        lost = queue[match(queue, sent, logged)]
+        delivered = np.concatenate([self.delivered, columns.ts[departures]])
+        self.late += np.count_nonzero(columns.delay[departures] >
+                                      self.horizon)
+
+        if len(columns.ts) == 0:
+            self.queue, self.delivered = lost, delivered
+            return merge(np.zeros(0), np.zeros(0))
+
+        # nothing logged from now on is older than this or can take a
+        # packet enqueued before it
+        settled = columns.ts[-1] - self.horizon - 2 * tolerance
+        self.queue = lost[lost >= settled]
+        self.delivered = delivered[delivered >= settled]
+        return merge(delivered[delivered < settled], lost[lost < settled])
+
+    def finish(self):
+        ts_lost = merge(self.delivered, self.queue)
+        self.queue, self.delivered = np.zeros(0), np.zeros(0)
+        return ts_lost
+
+
+def loss_trace(columns):
+    # lines of the loss trace of a whole log
+    stream = LossStream(float('inf'))
+    stream.feed(columns)
+    return stream.finish()
+
+
+def write_lines(trace, ts, is_lost):
+    for start in xrange(0, len(ts), write_lines_per_call):
+        lines = zip(ts[start:start + write_lines_per_call].tolist(),
+                    is_lost[start:start + write_lines_per_call].tolist())
+        trace.write(''.join(['%d x\n' % t if lost else '%d\n' % t
+                             for t, lost in lines]))
+
+
+def extract(log_path, trace_path):
+    stream = LossStream()
+    first_ts = None
+
+    with open(trace_path, 'w', 1 << 20) as trace:
+        for columns in datalink_log.iter_chunks(log_path):
+            if first_ts is None and len(columns.ts):
+                # the trace starts with one delivery per ms before the log
+                first_ts = int(columns.ts[0])
+                write_lines(trace, np.arange(1, max(first_ts, 1)),
+                            np.zeros(max(first_ts - 1, 0), dtype=bool))
+
+            write_lines(trace, *stream.feed(columns))
+        write_lines(trace, *stream.finish())
+
+    if stream.late:
+        sys.stderr.write('Warning: %d deliveries in %s were delayed over %d '
+                         'ms and may be reported lost\n' % (
+                             stream.late, log_path, stream.horizon))
 
 
 def main():
-    parser = argparse.ArgumentParser()
-    parser.add_argument(
-        '--data-dir',
-        metavar='DIR',
-        action='store',
-        dest='data_dir',
-        default='.',
-        help='directory containing json and logs to extract real traces')
-    args = parser.parse_args()
-    data_dir = path.abspath(args.data_dir)
-
-    # load pantheon_metadata.json as a dictionary
-    metadata_fname = path.join(data_dir, 'pantheon_metadata.json')
-    with open(metadata_fname) as metadata_file:
-        metadata_dict = json.load(metadata_file)
-
-    run_times = metadata_dict['run_times']
-    cc_schemes = metadata_dict['cc_schemes'].split()
-
-    for cc in cc_schemes:
-        for run_id in xrange(1, 1 + run_times):
-            log_path = path.join(args.data_dir,
-                                 '%s_datalink_run%s.log' % (cc, run_id))
-            trace_path = path.join(
-                args.data_dir, '%s_datalink_run%s.loss.trace' % (cc, run_id))
-            log = open(log_path)
-
-            first_ts = None
-            queue = []
-            delivery = []
-            for line in log:
-                if line.startswith('#'):
-                    continue
-
-                items = line.split()
-                ts = float(items[0])
-                if first_ts is None:
-                    first_ts = ts
-
-                if items[1] == '+':
-                    queue.append(ts)
-                elif items[1] == '-':
-                    delivery.append(ts)
-
-                    delay = float(items[3])
-                    sent_ts = ts - delay
-
-                    i = 0
-                    while True:
-                        if i >= len(queue):
-                            break
-
-                        if abs(sent_ts - queue[i]) <= 0.005:
-                            del queue[i]
-                            break
-
-                        i += 1
-
-            log.close()
-
-            trace = open(trace_path, 'w')
-            for ts in xrange(1, int(first_ts)):
-                trace.write('%s\n' % ts)
-
-            p1 = 0 # queue
-            p2 = 0 # delivery
-
-            while p1 < len(queue) or p2 < len(delivery):
-                if p1 < len(queue):
-                    ts1 = queue[p1]
-                else:
-                    ts1 = None
-
-                if p2 < len(delivery):
-                    ts2 = delivery[p2]
-                else:
-                    ts2 = None
-
-                if ts1 and ts2:
-                    if ts1 < ts2:
-                        trace.write('%s x\n' % int(round(ts1)))
-                        p1 += 1
-                    else:
-                        trace.write('%s\n' % int(round(ts2)))
-                        p2 += 1
-                elif ts1:
-                    trace.write('%s x\n' % int(round(ts1)))
-                    p1 += 1
-                elif ts2:
-                    trace.write('%s\n' % int(round(ts2)))
-                    p2 += 1
-
-            trace.close()
+    args = parse_args()
+    run_batch(extract, args.data_dirs, '.loss.trace', args.jobs, args.force)
+
 
 if __name__ == '__main__':
     main()
@@ -4,7 +4,7 @@ import sys
 from os import path
 sys.path.append(path.abspath(path.dirname(__file__)))
 import argparse
-from on_off_interval import get_on_off_interval
+from arrival_features import load_features
 from find_best_fit import find_best_fit
 
 
@@ -13,7 +13,7 @@ def main():
     parser.add_argument('log_path', metavar='LOG-PATH')
     args = parser.parse_args()
 
-    data = get_on_off_interval(args.log_path)
+    data = load_features(args.log_path).on_off_interval
     find_best_fit(data)
 
 
@@ -4,7 +4,7 @@ import sys
 import argparse
 from os import path
 sys.path.append(path.abspath(path.dirname(__file__)))
-from arrivals_per_ms import get_arrivals_per_ms
+from arrival_features import feature_histograms
 
 import matplotlib
 matplotlib.use('Agg')
@@ -16,14 +16,15 @@ def main():
     parser.add_argument('log_path', metavar='LOG-PATH')
     args = parser.parse_args()
 
-    data = get_arrivals_per_ms(args.log_path)
+    data = feature_histograms(args.log_path)['arrivals_per_ms']
+    values = data.keys()
 
     fig, ax = plt.subplots()
 
-    bins_num = max(data) - min(data)
+    bins_num = max(values) - min(values)
     if bins_num > 50:
         bins_num = 50
-    ax.hist(data, bins=bins_num, normed=True)
+    ax.hist(values, bins=bins_num, weights=data.values(), normed=True)
     ax.set_xlabel('Arrivals per ms')
     ax.set_ylabel('Frequency')
     ax.grid()
@@ -1,32 +1,14 @@
 #!/usr/bin/env python
 
 import sys
-import collections
+import argparse
 from os import path
+sys.path.append(path.abspath(path.dirname(__file__)))
+from arrival_features import load_features
 
 
 def get_on_off_interval(log_path):
-    # get on off interval
-    on_off_interval = []
-
-    log = open(log_path)
-
-    last_ts = None
-    for line in log:
-        items = line.split()
-        if len(items) < 4 or items[1] != '-':
-            continue
-
-        ts = int(items[0])
-
-        if last_ts != None and ts != last_ts:
-            on_off_interval.append(ts - last_ts)
-
-        last_ts = ts
-
-    log.close()
-
-    return on_off_interval
+    return load_features(log_path).on_off_interval.tolist()
 
 
 if __name__ == '__main__':
@@ -34,8 +16,7 @@ if __name__ == '__main__':
     parser.add_argument('log_path', metavar='LOG-PATH')
     args = parser.parse_args()
 
-    data = get_on_off_interval(args.log_path)
-    data_cnt = collections.Counter(data)
+    features = load_features(args.log_path)
 
     print 'Interval between two ON states (ms): (interval, occurrence)'
-    print sorted(data_cnt.items(), key=lambda x: x[0])
+    print features.histogram('on_off_interval')
@@ -1,49 +1,158 @@
 #!/usr/bin/env python
 
 import sys
-import os
+import mmap
+import argparse
+import numpy as np
 
+# lines per write of a rebased partition
+write_lines_per_call = 1 << 20
 
-def main():
-    if len(sys.argv) != 2:
-        sys.stderr.write('Usage: %s TRACE\n' % sys.argv[0])
-        exit(1)
 
-    trace_path = sys.argv[1]
+class TraceIndex(object):
+    """Line offsets of a memory-mapped trace of nondecreasing timestamps,
+    one per line. Timestamps are only parsed where they are needed: a
+    binary search reads O(log n) lines, and a partition parses its own."""
 
-    # read the last line of trace assuming it does not exceed 10 characters
-    with open(trace_path, 'rb') as trace:
-        first_ts = int(trace.readline())
-        trace.seek(-10, os.SEEK_END)
-        last_ts = int(trace.readlines()[-1])
+    def __init__(self, trace_path):
+        self.trace = open(trace_path, 'rb')
+        self.text = mmap.mmap(self.trace.fileno(), 0, access=mmap.ACCESS_READ)
 
-    trace = open(trace_path)
+        self.ends = np.flatnonzero(
+            np.frombuffer(self.text, dtype=np.uint8) == ord('\n'))
+        if len(self.text) and self.text[len(self.text) - 1] != '\n':
+            self.ends = np.append(self.ends, len(self.text))
+        self.starts = np.concatenate([[0], self.ends[:-1] + 1])
 
-    base_ts = 0
-    for run_id in xrange(1, 11):
-        new_trace = open('trace_%s' % run_id, 'w')
+    def __len__(self):
+        return len(self.ends)
+
+    def ts(self, i):
+        return int(self.text[self.starts[i]:self.ends[i]])
+
+    def search(self, ts):
+        # index of the first line whose timestamp is at least ts
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.ts(mid) < ts:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def lines(self, start, end):
+        # text of lines [start, end), each ending with a newline
+        if start >= end:
+            return ''
+        text = self.text[self.starts[start]:self.ends[end - 1]]
+        return text + '\n'
+
+    def write(self, out, start, end, base_ts):
+        if base_ts == 0:
+            out.write(self.lines(start, end))
+            return
 
-        if run_id < 10:
-            next_partition = first_ts + run_id * (last_ts - first_ts) / 10.0
+        for block in xrange(start, end, write_lines_per_call):
+            block_end = min(block + write_lines_per_call, end)
+            ts = np.fromstring(self.lines(block, block_end), dtype=np.int64,
+                               sep=' ')
+            out.write('\n'.join(map(str, (ts - base_ts).tolist())))
+            out.write('\n')
+
+    def close(self):
+        self.text.close()
+        self.trace.close()
+
+
+def equal_partitions(index, n):
+    """(start, end, base_ts) of n partitions of about equal duration, cut
+    like the original 10-way partitioner: partition k ends with the first
+    line at or past the k-th boundary, the next one starts right after it
+    with timestamps relative to it, and the first is not rebased. As
+    before, partitioning stops at the partition that reaches the end of
+    the trace, so a short trace gets fewer partitions."""
+    first_ts = index.ts(0)
+    last_ts = index.ts(len(index) - 1)
+
+    partitions = []
+    start = 0
+    base_ts = 0
+    for run_id in xrange(1, n + 1):
+        if run_id < n:
+            boundary = first_ts + run_id * (last_ts - first_ts) / float(n)
+            end = max(start, index.search(boundary)) + 1
         else:
-            next_partition = last_ts + 1
+            end = len(index) + 1
+
+        if end > len(index):
+            partitions.append((start, len(index), base_ts))
+            break
+
+        partitions.append((start, end, base_ts))
+        base_ts = index.ts(end - 1)
+        start = end
+
+    return partitions
+
+
+def windows(index, window, step):
+    """(start, end, base_ts) of every window of window ms that starts a
+    multiple of step ms after the first line and fits in the trace;
+    timestamps are relative to the start of their window, and windows
+    overlap when step is less than window."""
+    first_ts = index.ts(0)
+    last_ts = index.ts(len(index) - 1)
+
+    partitions = []
+    start_ts = first_ts
+    while start_ts + window <= last_ts + 1:
+        partitions.append((index.search(start_ts),
+                           index.search(start_ts + window), start_ts))
+        start_ts += step
+
+    return partitions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('trace_path', metavar='TRACE')
+    parser.add_argument('-n', '--partitions', type=int, default=10,
+                        help='number of partitions of equal duration '
+                        '(default 10)')
+    parser.add_argument('--window', type=int, metavar='MS',
+                        help='cut windows of this many ms instead')
+    parser.add_argument('--step', type=int, metavar='MS',
+                        help='ms between the starts of consecutive windows '
+                        '(default: the window length)')
+    parser.add_argument('--prefix', default='trace_',
+                        help='partitions are written to PREFIX1, PREFIX2, ... '
+                        '(default trace_)')
+    args = parser.parse_args()
 
-        curr_ts = None
-        while True:
-            line = trace.readline()
-            if not line:
-                exit(0)
+    if args.partitions < 1:
+        parser.error('--partitions must be at least 1')
+    if args.window is not None and args.window < 1:
+        parser.error('--window must be at least 1')
+    if args.step is not None and args.step < 1:
+        parser.error('--step must be at least 1')
 
-            curr_ts = int(line)
-            new_trace.write('%s\n' % (curr_ts - base_ts))
+    index = TraceIndex(args.trace_path)
+    if len(index) == 0:
+        sys.exit('%s is empty' % args.trace_path)
 
-            if curr_ts >= next_partition:
-                base_ts = curr_ts
-                break
+    if args.window is None:
+        partitions = equal_partitions(index, args.partitions)
+    else:
+        partitions = windows(index, args.window, args.step or args.window)
+        if not partitions:
+            sys.exit('%s is shorter than one window' % args.trace_path)
 
-        new_trace.close()
+    for run_id, (start, end, base_ts) in enumerate(partitions, 1):
+        with open('%s%s' % (args.prefix, run_id), 'w') as out:
+            index.write(out, start, end, base_ts)
 
-    trace.close()
+    index.close()
 
 
 if __name__ == '__main__':
@@ -1,55 +1,67 @@
 #!/usr/bin/env python
 
+import sys
+import random
 import argparse
 import numpy as np
+from os import path
 from hmmlearn import hmm
+sys.path.append(path.abspath(path.dirname(__file__)))
+from arrival_features import load_features, iter_features
 
 
 # get arrivals or silence per ms
 def get_arrivals_per_ms(log_path):
-    # get arrivals per ms
-    arrivals_per_ms = []
-    pkts = 0
-
-    log = open(log_path)
-
-    last_ts = None
-    for line in log:
-        items = line.split()
-        if len(items) < 4 or items[1] != '-':
-            continue
-
-        ts = int(items[0])
-
-        if ts != last_ts:
-            if last_ts != None:
-                arrivals_per_ms.append(pkts)
-
-                for silent_ts in xrange(last_ts + 1, ts):
-                    arrivals_per_ms.append(0)
-
-            pkts = 1
+    return load_features(log_path).arrivals_per_ms_with_silence.tolist()
+
+
+# the HMM is fit on at most max_segments sequences of segment_ms ms each,
+# as long as a generated trace, sampled uniformly from the whole log
+segment_ms = 60000
+max_segments = 20
+
+
+def segments(log_path):
+    # consecutive segment_ms pieces of arrivals per ms, the last one
+    # possibly shorter; only allow output to be [0, 26], a signed byte per ms
+    pieces = []
+    size = 0
+    for features in iter_features(log_path):
+        x = np.minimum(features.arrivals_per_ms_with_silence, 26)
+        x = x.astype(np.int8)
+        while len(x):
+            take = min(segment_ms - size, len(x))
+            pieces.append(x[:take])
+            size += take
+            x = x[take:]
+            if size == segment_ms:
+                yield np.concatenate(pieces)
+                pieces = []
+                size = 0
+
+    if size:
+        yield np.concatenate(pieces)
+
+
+def sample_segments(log_path, seed=0):
+    # reservoir sampling keeps max_segments of them however long the log is
+    rng = random.Random(seed)
+    sample = []
+    for i, segment in enumerate(segments(log_path)):
+        if i < max_segments:
+            sample.append(segment)
         else:
-            pkts += 1
-
-        last_ts = ts
-
-    log.close()
-
-    return arrivals_per_ms
+            j = rng.randint(0, i)
+            if j < max_segments:
+                sample[j] = segment
+    return sample
 
 
 def train_hmm(log_path):
-    X = get_arrivals_per_ms(log_path)
+    X = sample_segments(log_path)
 
     # add at least one value in case any value is missing
-    for i in xrange(0, 27):
-        X.append(i)
-
-    # only allow output to be [0, 26]
-    for i in xrange(len(X)):
-        if X[i] > 26:
-            X[i] = 26
+    X.append(np.arange(27, dtype=np.int8))
 
     # initialize start probability and transition matrix
     n_states = 4
@@ -68,8 +80,7 @@ def train_hmm(log_path):
     model.transmat_ = trans_mat
     model.emissionprob_ = emission_prob
 
-    X = np.array([X])
-    model.fit(X.T)
+    model.fit(np.concatenate(X).reshape(-1, 1), lengths=map(len, X))
 
     return model
 
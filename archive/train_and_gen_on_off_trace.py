@@ -1,13 +1,11 @@
 #!/usr/bin/env python
 
 import sys
-import collections
 import random
 import argparse
 from os import path
 sys.path.append(path.abspath(path.dirname(__file__)))
-from on_off_interval import get_on_off_interval
-from arrivals_per_ms import get_arrivals_per_ms
+from arrival_features import feature_histograms
 
 
 def weighted_pick(d):
@@ -23,22 +21,23 @@ def weighted_pick(d):
 
 
 def main(log_path):
-    # calculate Marcov MLE of transition matrix
-    on_off_interval = get_on_off_interval(log_path)
+    histograms = feature_histograms(log_path)
 
+    # calculate Marcov MLE of transition matrix
     states = [0, 0]  # off, on
     trans = [[0, 0], [0, 0]]
 
-    for interval in on_off_interval:
-        states[0] += interval - 1
-        states[1] += 1
+    # every occurrence of an interval counts the same
+    for interval, n in histograms['on_off_interval'].iteritems():
+        states[0] += n * (interval - 1)
+        states[1] += n
 
         if interval == 1:
-            trans[1][1] += 1
+            trans[1][1] += n
         else:
-            trans[0][1] += 1
-            trans[1][0] += 1
-            trans[0][0] += interval - 2
+            trans[0][1] += n
+            trans[1][0] += n
+            trans[0][0] += n * (interval - 2)
 
     trans_prob = [[0, 0], [0, 0]]
 
@@ -47,8 +46,7 @@ def main(log_path):
             trans_prob[s][t] = float(trans[s][t]) / float(states[s])
 
     # empirical emission probability distribution
-    arrivals_per_ms = get_arrivals_per_ms(log_path)
-    emission_cnt = collections.Counter(arrivals_per_ms)
+    emission_cnt = histograms['arrivals_per_ms']
 
     # generate trace
     for i in xrange(1, 11):
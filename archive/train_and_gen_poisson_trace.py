@@ -5,12 +5,13 @@ import random
 import argparse
 from os import path
 sys.path.append(path.abspath(path.dirname(__file__)))
-from interarrival_times import get_interarrival_times
+from arrival_features import feature_histograms
 
 
 def train_lambda(log_path):
-    data = get_interarrival_times(log_path)
-    return float(len(data) - 1) / sum(data)
+    data = feature_histograms(log_path)['interarrival_times']
+    return (float(sum(data.itervalues()) - 1) /
+            sum(t * n for t, n in data.iteritems()))
 
 
 def generate_trace(lambd):
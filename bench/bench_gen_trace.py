@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+from os import path
+from subprocess import check_call
+sys.path.append(path.join(path.abspath(path.dirname(__file__)), '..'))
+import gen_const_bandwidth_trace
+
+gen_trace_src = path.join(path.abspath(path.dirname(__file__)), '..',
+                          'gen_const_bandwidth_trace.py')
+
+
+def write_trace_per_second(trace_path, mbps):
+    # what gen_const_bandwidth_trace.py used to do
+    pkts_per_sec = int(round(mbps * 250 / 3))
+    trace = open(trace_path, 'w')
+    for sec in xrange(0, 60):
+        ts_list = np.random.uniform(sec * 1000, (sec + 1) * 1000, pkts_per_sec)
+        ts_list = sorted(map(int, ts_list))
+        for ts in ts_list:
+            trace.write('%s\n' % ts)
+    trace.close()
+
+
+def timed(rounds, func):
+    start_ts = time.time()
+    for _ in xrange(rounds):
+        func()
+    return (time.time() - start_ts) / rounds
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mbps', type=float, default=12.0)
+    parser.add_argument('--rounds', type=int, default=10)
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp()
+    trace_path = path.join(tmp_dir, 'bench.trace')
+    bw = '%.2f' % args.mbps
+
+    try:
+        subprocess_time = timed(args.rounds, lambda: check_call(
+            [sys.executable, gen_trace_src, bw], cwd=tmp_dir))
+        per_second_time = timed(args.rounds, lambda: write_trace_per_second(
+            trace_path, args.mbps))
+        vectorized_time = timed(args.rounds, lambda:
+                                gen_const_bandwidth_trace.write_trace(
+                                    trace_path,
+                                    gen_const_bandwidth_trace.gen_trace(
+                                        [(0, args.mbps)])))
+        lines = len(open(trace_path).readlines())
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    print '%s Mbit/s, %d lines per trace, %d rounds' % (bw, lines,
+                                                        args.rounds)
+    print 'subprocess per trace: %.3fs' % subprocess_time
+    print 'per-second loop:      %.3fs' % per_second_time
+    print 'vectorized:           %.3fs' % vectorized_time
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+
+import sys
+import time
+import argparse
+import numpy as np
+from os import path
+sys.path.append(path.join(path.abspath(path.dirname(__file__)), '..'))
+sys.path.append(path.join(path.abspath(path.dirname(__file__)), '..',
+                          'archive'))
+import datalink_log
+from datalink_log import ARRIVAL, DEPARTURE
+from extract_traces_with_loss import unmatched_arrivals
+
+
+def deep_queue_log(packets, depth, loss, seed):
+    """Columns of a bufferbloated link: packets arrive one per ms into a
+    queue kept about depth packets deep, and a fraction loss of them is
+    never delivered."""
+    rng = np.random.RandomState(seed)
+
+    arrival_ts = np.arange(1, packets + 1, dtype=np.float64)
+    delivered = rng.uniform(size=packets) >= loss
+    # every delivered packet leaves depth ms after it arrived, plus jitter
+    jitter = rng.randint(0, 3, size=delivered.sum())
+    departure_ts = arrival_ts[delivered] + depth + jitter
+    departure_ts = np.maximum.accumulate(departure_ts)
+    delay = departure_ts - arrival_ts[delivered]
+
+    ts = np.concatenate([arrival_ts, departure_ts])
+    event = np.concatenate([np.repeat(np.uint8(ARRIVAL), packets),
+                            np.repeat(np.uint8(DEPARTURE), len(departure_ts))])
+    delays = np.concatenate([np.repeat(np.nan, packets), delay])
+    order = np.lexsort((event == ARRIVAL, ts))
+
+    return datalink_log.Columns(ts=ts[order], event=event[order],
+                                size=np.repeat(1500, len(ts)),
+                                delay=delays[order])
+
+
+def unmatched_arrivals_linear(columns):
+    # what extract_traces_with_loss.py used to do
+    queue = []
+    index = []
+    arrivals = 0
+    for ts, event, delay in zip(columns.ts.tolist(), columns.event.tolist(),
+                                columns.delay.tolist()):
+        if event == ARRIVAL:
+            queue.append(ts)
+            index.append(arrivals)
+            arrivals += 1
+        elif event == DEPARTURE:
+            sent_ts = ts - delay
+            i = 0
+            while True:
+                if i >= len(queue):
+                    break
+                if abs(sent_ts - queue[i]) <= 0.005:
+                    del queue[i]
+                    del index[i]
+                    break
+                i += 1
+
+    unmatched = np.zeros(arrivals, dtype=bool)
+    unmatched[index] = True
+    return unmatched
+
+
+def timed(func, *args):
+    start_ts = time.time()
+    result = func(*args)
+    return time.time() - start_ts, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--packets', type=int, default=50000)
+    parser.add_argument('--depth', type=int, default=2000,
+                        help='queueing delay in ms (default 2000)')
+    parser.add_argument('--loss', type=float, default=0.02)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    columns = deep_queue_log(args.packets, args.depth, args.loss, args.seed)
+
+    linear_time, linear = timed(unmatched_arrivals_linear, columns)
+    indexed_time, indexed = timed(unmatched_arrivals, columns)
+    if not np.array_equal(linear, indexed):
+        sys.exit('the matchers disagree')
+
+    print '%d packets, %d ms deep queue, %d never delivered' % (
+        args.packets, args.depth, indexed.sum())
+    print 'linear scan:   %.3fs' % linear_time
+    print 'indexed match: %.3fs' % indexed_time
+
+
+if __name__ == '__main__':
+    main()
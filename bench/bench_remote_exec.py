@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+import sys
+import time
+import argparse
+from os import path
+from subprocess import Popen
+sys.path.append(path.join(path.abspath(path.dirname(__file__)), '..'))
+from remote_exec import LocalExecutor, SshExecutor
+
+
+def run_unpooled(hosts, cmd, ssh_user):
+    # what proxy_master used to do: one fresh process per host
+    procs = []
+    for host in hosts:
+        if ssh_user:
+            argv = ['ssh', '%s@%s' % (ssh_user, host), cmd]
+        else:
+            argv = ['sh', '-c', cmd]
+        procs.append(Popen(argv))
+
+    for proc in procs:
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--hosts', type=int, default=90,
+                        help='number of fake hosts for the local backend')
+    parser.add_argument('--hosts-file', metavar='FILE',
+                        help='benchmark ssh against the hosts in FILE')
+    parser.add_argument('--user', default='ubuntu')
+    parser.add_argument('--cmd', default='true')
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--max-concurrency', type=int, default=64)
+    args = parser.parse_args()
+
+    if args.hosts_file:
+        with open(args.hosts_file) as f:
+            hosts = [x.strip() for x in f if x.strip()]
+        executor = SshExecutor(user=args.user,
+                               max_concurrency=args.max_concurrency)
+        executor.start(hosts)
+        ssh_user = args.user
+    else:
+        hosts = ['host%d' % i for i in xrange(args.hosts)]
+        executor = LocalExecutor(max_concurrency=args.max_concurrency)
+        ssh_user = None
+
+    start_ts = time.time()
+    for _ in xrange(args.rounds):
+        run_unpooled(hosts, args.cmd, ssh_user)
+    unpooled = (time.time() - start_ts) / args.rounds
+
+    start_ts = time.time()
+    for _ in xrange(args.rounds):
+        results = executor.run_all([(host, args.cmd) for host in hosts])
+    pooled = (time.time() - start_ts) / args.rounds
+    executor.close()
+
+    failed = [r for r in results if not r.ok]
+    elapsed = sorted(r.elapsed for r in results)
+
+    print 'hosts: %d, rounds: %d' % (len(hosts), args.rounds)
+    print 'unpooled round: %.3fs' % unpooled
+    print 'executor round: %.3fs (failed: %d)' % (pooled, len(failed))
+    print 'per-host elapsed: min %.3fs, median %.3fs, max %.3fs' % (
+        elapsed[0], elapsed[len(elapsed) / 2], elapsed[-1])
+
+
+if __name__ == '__main__':
+    main()
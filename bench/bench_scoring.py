@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+from os import path
+from subprocess import check_output
+sys.path.append(path.join(path.abspath(path.dirname(__file__)), '..'))
+import scoring
+
+compare_src = path.expanduser('~/pantheon/analyze/compare_two_experiments.py')
+
+
+def write_synthetic_experiment(logs_dir, schemes, run_times, seconds, mbps,
+                               delay):
+    os.makedirs(logs_dir)
+    with open(path.join(logs_dir, 'pantheon_metadata.json'), 'w') as f:
+        json.dump({'cc_schemes': ' '.join(schemes), 'run_times': run_times,
+                   'runtime': seconds, 'flows': 1, 'interval': 0,
+                   'sender_side': 'local'}, f)
+
+    pkts_per_ms = mbps * 250 / 3 / 1000.0
+    for cc in schemes:
+        for run_id in xrange(1, run_times + 1):
+            lines = ['# base timestamp: 0']
+            for ms in xrange(seconds * 1000):
+                lines.append('%d # 1500' % ms)
+                if random.random() < pkts_per_ms:
+                    d = delay + random.randint(0, 20)
+                    lines.append('%d + 1500' % ms)
+                    lines.append('%d - 1500 %d' % (ms + d, d))
+            with open(scoring.log_path(logs_dir, cc, run_id), 'w') as f:
+                f.write('\n'.join(lines) + '\n')
+
+
+def pantheon_scores(real_dir, emu_dir, schemes):
+    results = check_output(['python', compare_src, real_dir, emu_dir,
+                            '--analyze-schemes', ' '.join(schemes)])
+    scores = results.split('\n')
+    return tuple(float(scores[i][:-1]) for i in (-6, -4, -2))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('real_dir', nargs='?', metavar='REAL-LOGS-DIR')
+    parser.add_argument('emu_dir', nargs='?', metavar='EMULATED-LOGS-DIR')
+    parser.add_argument('--schemes', default='default_tcp vegas ledbat pcc '
+                        'verus scream sprout webrtc quic')
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+    schemes = args.schemes.split()
+
+    tmp_dir = None
+    if args.real_dir is None:
+        # synthetic 10-run, 30 s experiments when no logs are given
+        tmp_dir = tempfile.mkdtemp(prefix='bench-scoring-')
+        args.real_dir = path.join(tmp_dir, 'real')
+        args.emu_dir = path.join(tmp_dir, 'emulated')
+        write_synthetic_experiment(args.real_dir, schemes, 10, 30, 8, 40)
+        write_synthetic_experiment(args.emu_dir, schemes, 10, 30, 9, 50)
+
+    start_ts = time.time()
+    for _ in xrange(args.rounds):
+        native = scoring.scores_tuple(scoring.score_experiments(
+            args.real_dir, args.emu_dir, schemes))
+    native_time = (time.time() - start_ts) / args.rounds
+    print 'native:   %.2f%% %.2f%% %.2f%% in %.3fs' % (native + (native_time,))
+
+    if path.isfile(compare_src):
+        start_ts = time.time()
+        for _ in xrange(args.rounds):
+            pantheon = pantheon_scores(args.real_dir, args.emu_dir, schemes)
+        pantheon_time = (time.time() - start_ts) / args.rounds
+        print 'pantheon: %.2f%% %.2f%% %.2f%% in %.3fs' % (
+            pantheon + (pantheon_time,))
+        print 'max score difference: %.4f, speedup: %.1fx' % (
+            max(abs(a - b) for a, b in zip(native, pantheon)),
+            pantheon_time / native_time)
+    else:
+        print 'pantheon not found at %s, skipping comparison' % compare_src
+
+    if tmp_dir is not None:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+
+import os
+import re
+import mmap
+import collections
+import numpy as np
+
+# mahimahi log events, stored as their ASCII codes in the event column
+ARRIVAL = ord('+')
+DEPARTURE = ord('-')
+OPPORTUNITY = ord('#')
+
+# "timestamp event size [delay]"; header lines start with '#' and the
+# optional trailing flow id is ignored
+line_re = re.compile(r'^(\d+(?:\.\d*)?) ([-+#]) (\d+)(?: (\d+(?:\.\d*)?))?',
+                     re.MULTILINE)
+
+Columns = collections.namedtuple('Columns', ['ts', 'event', 'size', 'delay'])
+
+
+def empty_columns():
+    return Columns(ts=np.zeros(0, dtype=np.float64),
+                   event=np.zeros(0, dtype=np.uint8),
+                   size=np.zeros(0, dtype=np.int64),
+                   delay=np.zeros(0, dtype=np.float64))
+
+
+def parse(text):
+    """Turn the text of a datalink log into typed columns.
+
+    delay is NaN on lines that do not carry one (arrivals, opportunities).
+    """
+    rows = line_re.findall(text)
+    if not rows:
+        return empty_columns()
+
+    # joining each column and parsing it in one call is much faster than
+    # converting the fields one by one
+    ts, event, size, delay = zip(*rows)
+    return Columns(
+        ts=np.fromstring(' '.join(ts), sep=' '),
+        event=np.fromstring(''.join(event), dtype=np.uint8),
+        size=np.fromstring(' '.join(size), dtype=np.int64, sep=' '),
+        delay=np.fromstring(' '.join([d or 'nan' for d in delay]), sep=' '))
+
+
+def parse_file(log_path):
+    # the regex scans the mapped file directly, so the text of a large log
+    # is never copied into one Python string
+    with open(log_path, 'rb') as log:
+        if os.fstat(log.fileno()).st_size == 0:
+            return empty_columns()
+        text = mmap.mmap(log.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            return parse(text)
+        finally:
+            text.close()
+
+
+def iter_chunks(log_path, chunk_bytes=64 * 1024 ** 2):
+    """Columns of the datalink log at log_path, a block of about
+    chunk_bytes of text at a time, so that memory use does not grow with
+    the size of the log. Blocks end at line boundaries; a block may hold
+    no event at all."""
+    with open(log_path, 'rb') as log:
+        size = os.fstat(log.fileno()).st_size
+        if size == 0:
+            return
+        text = mmap.mmap(log.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            start = 0
+            while start < size:
+                end = text.find('\n', min(start + chunk_bytes, size) - 1)
+                end = size if end < 0 else end + 1
+                yield parse(text[start:end])
+                start = end
+        finally:
+            text.close()
+
+
+# bumped whenever parse() changes what it stores in the columns
+columns_version = 1
+
+
+def columns_path(log_path):
+    return log_path + '.columns.npz'
+
+
+def source_stamp(st):
+    return np.array([columns_version, st.st_size, st.st_mtime])
+
+
+def read_columns(log_path, st):
+    try:
+        with np.load(columns_path(log_path)) as saved:
+            if not np.array_equal(saved['source'], source_stamp(st)):
+                return None
+            return Columns(**dict((name, saved[name])
+                                  for name in Columns._fields))
+    except (IOError, KeyError, ValueError):
+        return None
+
+
+def write_columns(log_path, st, columns):
+    dst_path = columns_path(log_path)
+    tmp_path = '%s.%d.tmp' % (dst_path, os.getpid())
+    try:
+        with open(tmp_path, 'wb') as columns_file:
+            np.savez(columns_file, source=source_stamp(st),
+                     **columns._asdict())
+        os.rename(tmp_path, dst_path)
+    except (IOError, OSError):
+        # a read-only log directory only costs the next load a parse
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+
+def load(log_path, sidecar=False):
+    """Columns of the datalink log at log_path.
+
+    With sidecar, the columns are also saved next to the log in
+    LOG.columns.npz and loaded from there as long as the log keeps the
+    size and mtime it had when they were parsed.
+    """
+    if not sidecar:
+        return parse_file(log_path)
+
+    st = os.stat(log_path)
+    columns = read_columns(log_path, st)
+    if columns is None:
+        columns = parse_file(log_path)
+        write_columns(log_path, st, columns)
+    return columns
+
+
+def delivery_ms(columns):
+    # whole-ms times of the departure lines that carry a delay, which is
+    # what the archive analysis scripts count as deliveries
+    keep = (columns.event == DEPARTURE) & ~np.isnan(columns.delay)
+    return columns.ts[keep].astype(np.int64)
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+
+import os
+import json
+import time
+from os import path
+
+emulation_params = ['bandwidth', 'delay', 'uplink_queue', 'uplink_loss',
+                    'downlink_loss']
+
+# step of each parameter below which two candidates count as the same
+# emulated configuration; matches the precision run_proxy is given
+default_quantization = {
+    'bandwidth': 0.01,
+    'delay': 1,
+    'uplink_queue': 1,
+    'uplink_loss': 0.0001,
+    'downlink_loss': 0.0001,
+}
+
+
+def quantize(x, step):
+    return int(round(float(x) / step))
+
+
+def evaluation_settings(args):
+    # everything besides the emulation parameters that a score depends on
+    return ['schemes=%s' % ','.join(args['schemes']),
+            'run_times=%s' % args['run_times'],
+            'replicate=%s' % args['replicate'],
+            'runtime=%s' % args['runtime'],
+            'fidelities=%s' % ','.join('%dx%ds' % tuple(rung)
+                                       for rung in args['fidelities']),
+            'promote_quantile=%r' % args['promote_quantile'],
+            'sequential=%s' % args['sequential'],
+            'run_wave=%s' % args['run_wave'],
+            'max_ci_width=%r' % args['max_ci_width'],
+            'confidence=%r' % args['confidence'],
+            'seed=%s' % args['seed'],
+            'sampling=%s' % args['sampling'],
+            'scoring=%s' % ('native' if args['native_scoring']
+                            else 'pantheon')]
+
+
+class EvalCache(object):
+    """On-disk scores of past evaluations.
+
+    Entries are keyed by the quantized (mean, stddev) of every emulation
+    parameter plus the evaluation settings: schemes, runs and fidelities,
+    the promotion and stopping rules, seed and sampling, real logs being
+    replicated and scoring mode. Only scores measured at full fidelity
+    are meant to be put.
+    Entries older than ttl seconds are dropped, and once there are more
+    than max_entries the least recently used ones are evicted.
+    """
+
+    def __init__(self, cache_path, quantization=None, ttl=None,
+                 max_entries=None):
+        self.cache_path = cache_path
+        self.quantization = dict(default_quantization)
+        if quantization:
+            self.quantization.update(quantization)
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+
+        if path.isfile(cache_path):
+            with open(cache_path) as cache_file:
+                try:
+                    content = json.load(cache_file)
+                except ValueError:
+                    content = {}
+
+            self.entries = content.get('entries', {})
+            self.hits = content.get('hits', 0)
+            self.misses = content.get('misses', 0)
+
+    def key(self, args):
+        items = []
+        for name in emulation_params:
+            step = self.quantization[name]
+            items.append('%s=%d,%d' % (name, quantize(args[name][0], step),
+                                       quantize(args[name][1], step)))
+
+        items += evaluation_settings(args)
+        return ';'.join(items)
+
+    def expired(self, entry, now):
+        return self.ttl is not None and now - entry['created'] > self.ttl
+
+    def get(self, args):
+        now = time.time()
+        key = self.key(args)
+
+        entry = self.entries.get(key)
+        if entry is not None and self.expired(entry, now):
+            del self.entries[key]
+            entry = None
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        entry['last_used'] = now
+        return tuple(entry['scores'])
+
+    def put(self, args, scores):
+        now = time.time()
+        self.entries[self.key(args)] = {
+            'scores': list(scores), 'created': now, 'last_used': now}
+        self.evict(now)
+
+    def evict(self, now):
+        for key in [k for k, e in self.entries.items()
+                    if self.expired(e, now)]:
+            del self.entries[key]
+
+        if self.max_entries is not None:
+            excess = len(self.entries) - self.max_entries
+            if excess > 0:
+                lru = sorted(self.entries,
+                             key=lambda k: self.entries[k]['last_used'])
+                for key in lru[:excess]:
+                    del self.entries[key]
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        if lookups == 0:
+            return 0.0
+        return float(self.hits) / lookups
+
+    def stats(self):
+        return 'eval cache: %d hits, %d misses, hit rate %.2f, %d entries' % (
+            self.hits, self.misses, self.hit_rate(), len(self.entries))
+
+    def save(self):
+        # write to a temporary file and rename it so that a crash never
+        # leaves a truncated cache behind
+        tmp_path = '%s.%d.tmp' % (self.cache_path, os.getpid())
+        with open(tmp_path, 'w') as cache_file:
+            json.dump({'entries': self.entries, 'hits': self.hits,
+                       'misses': self.misses}, cache_file)
+        os.rename(tmp_path, self.cache_path)
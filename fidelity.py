@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+
+import math
+
+from scheduler import median
+
+
+def format_fidelity(run_times, runtime):
+    return '%dx%ds' % (run_times, runtime)
+
+
+def sequential_rungs(fidelities, wave):
+    # the last rung becomes waves of wave more runs, continuing from the
+    # rung before it if that has the same runtime; earlier rungs are kept
+    # for successive halving
+    run_times, runtime = fidelities[-1]
+    start = 0
+    if len(fidelities) > 1 and fidelities[-2][1] == runtime:
+        start = fidelities[-2][0]
+
+    waves = range(start + wave, run_times, wave) + [run_times]
+    return fidelities[:-1] + [(n, runtime) for n in waves]
+
+
+def rung_scores(record):
+    return record.get('rung_scores', [])
+
+
+class SuccessiveHalving(object):
+    """Asynchronous successive halving over (run_times, runtime) rungs.
+
+    A candidate scored at a rung is promoted to the next one if it could
+    still be a new best or ranks within the top promote_quantile of all
+    scores recorded at that rung in the search log. Until a rung has
+    min_history scores, everything is promoted.
+
+    A candidate stopped early is reported to the optimizer with the
+    median gap between final and rung scores of the candidates that went
+    all the way, so that low-fidelity scores are comparable with full
+    ones instead of looking optimistically noisy. Rungs from full_rung
+    on (by default only the last one) are full fidelity; with sequential
+    stopping they are the waves, and a candidate's final score is the
+    one of the last wave it ran.
+    """
+
+    def __init__(self, rungs, records, promote_quantile=1.0 / 3,
+                 min_history=5, full_rung=None):
+        self.rungs = rungs
+        self.promote_quantile = promote_quantile
+        self.min_history = min_history
+        if full_rung is None:
+            full_rung = len(rungs) - 1
+        self.full_rung = full_rung
+        self.history = [rung_scores(r) for r in records]
+
+    def history_at(self, rung):
+        return [scores[rung] for scores in self.history
+                if len(scores) > rung]
+
+    def should_promote(self, rung, score, best_score):
+        if rung + 1 >= len(self.rungs):
+            return False
+
+        if score < best_score:
+            return True
+
+        history = sorted(self.history_at(rung))
+        if len(history) < self.min_history:
+            return True
+
+        top = int(math.ceil(len(history) * self.promote_quantile))
+        cutoff = history[max(0, top - 1)]
+        return score <= cutoff
+
+    def noise_aware_score(self, rung, score):
+        if rung >= self.full_rung:
+            return score
+
+        gaps = [scores[-1] - scores[rung] for scores in self.history
+                if len(scores) > self.full_rung]
+        if not gaps:
+            return score
+
+        return score + median(gaps)
+
+    def record(self, scores):
+        self.history.append(list(scores))
+
+
+class SequentialStopping(object):
+    """Decides after every wave of runs whether a candidate needs more.
+
+    A candidate stops once the confidence interval of its score is at
+    most max_ci_width (percentage points) wide, or once even the lower
+    end of the interval is worse than the best score so far. Bootstrap
+    intervals of very few runs are too narrow to be trusted as precise,
+    hence min_runs.
+    """
+
+    def __init__(self, max_ci_width, min_runs=3):
+        self.max_ci_width = max_ci_width
+        self.min_runs = min_runs
+
+    def stop_reason(self, ci, best_score, runs):
+        low, high = ci
+        if high - low <= self.max_ci_width and runs >= self.min_runs:
+            return 'precise'
+        if low > best_score:
+            return 'cannot beat best'
+        return None
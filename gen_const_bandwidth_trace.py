@@ -3,22 +3,79 @@
 import argparse
 import numpy as np
 
+
+def pkts_per_sec(mbps):
+    # mahimahi delivers one 1500-byte packet per line of a trace
+    return int(round(float(mbps) * 250 / 3))
+
+
+def parse_schedule(schedule):
+    # "start_sec:mbps,start_sec:mbps,..."
+    segments = []
+    for item in schedule.split(','):
+        start, mbps = item.split(':')
+        segments.append((int(start), float(mbps)))
+    return segments
+
+
+def gen_trace(schedule, duration=60, seed=None):
+    """Packet delivery times (ms) of a trace whose bandwidth follows
+    schedule, a list of (start_sec, mbps) segments each lasting until the
+    next one starts; [(0, mbps)] is a constant bandwidth.
+
+    Every second gets as many uniformly spread delivery times as its
+    bandwidth allows, like the original one-second-at-a-time generator.
+    """
+    rng = np.random.RandomState(seed)
+
+    schedule = sorted(schedule)
+    ends = [start for start, _ in schedule[1:]] + [duration]
+
+    counts = np.zeros(duration, dtype=np.int64)
+    for (start, mbps), end in zip(schedule, ends):
+        counts[start:end] = pkts_per_sec(mbps)
+
+    secs = np.repeat(np.arange(duration, dtype=np.int64), counts)
+    ts = (secs * 1000 + rng.uniform(0, 1000, len(secs))).astype(np.int64)
+    # every second covers its own range of times, so one global sort is
+    # the same as sorting each second
+    ts.sort()
+    return ts
+
+
+def write_trace(trace_path, ts):
+    with open(trace_path, 'w') as trace:
+        trace.write('\n'.join(map(str, ts.tolist())))
+        if len(ts):
+            trace.write('\n')
+
+
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument('bandwidth', metavar='bandwidth_mbps')
+    parser.add_argument('bandwidth', metavar='bandwidth_mbps', nargs='?')
+    parser.add_argument('--schedule', metavar='START:MBPS,START:MBPS,...',
+                        help='piecewise constant bandwidth instead of a '
+                        'single one, starting at the given seconds')
+    parser.add_argument('--duration', type=int, default=60,
+                        metavar='SECONDS')
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('-o', '--output', metavar='TRACE')
     args = parser.parse_args()
 
-    pkts_per_sec = int(round(float(args.bandwidth) * 250 / 3))
-    trace = open(args.bandwidth + 'mbps.trace', 'w')
-
-    for sec in xrange(0, 60):
-        ts_list = np.random.uniform(sec * 1000, (sec + 1) * 1000, pkts_per_sec)
-        ts_list = sorted(map(int, ts_list))
+    if args.schedule:
+        schedule = parse_schedule(args.schedule)
+    elif args.bandwidth:
+        schedule = [(0, float(args.bandwidth))]
+    else:
+        parser.error('either bandwidth_mbps or --schedule is required')
 
-        for ts in ts_list:
-            trace.write('%s\n' % ts)
+    output = args.output
+    if output is None:
+        if not args.bandwidth:
+            parser.error('--output is required with --schedule')
+        output = args.bandwidth + 'mbps.trace'
 
-    trace.close()
+    write_trace(output, gen_trace(schedule, args.duration, args.seed))
 
 
 if __name__ == '__main__':
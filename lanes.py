@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import time
+import getpass
+import multiprocessing
+from os import path
+from subprocess import Popen, PIPE, call
+
+
+def cpu_times():
+    # total and idle (idle + iowait) jiffies of all cores
+    with open('/proc/stat') as stat:
+        fields = map(int, stat.readline().split()[1:])
+    return sum(fields), fields[3] + fields[4]
+
+
+def busy_fraction(start, end):
+    total = end[0] - start[0]
+    if total <= 0:
+        return 0.0
+    return 1.0 - float(end[1] - start[1]) / total
+
+
+def netns_name(lane):
+    return 'replication-lane%d' % lane
+
+
+def setup_netns(lanes):
+    # a lane only has its own loopback: no veth or NAT connects it to the
+    # host, so it only suits runs whose sender and receiver are both local.
+    # mahimahi refuses to start unless IP forwarding is on, and a new
+    # namespace starts with it off
+    with open(os.devnull, 'w') as devnull:
+        existing = Popen(['ip', 'netns', 'list'],
+                         stdout=PIPE, stderr=devnull).communicate()[0]
+    existing = [line.split()[0] for line in existing.splitlines() if line]
+
+    for lane in xrange(lanes):
+        ns = netns_name(lane)
+        if ns not in existing:
+            call(['sudo', 'ip', 'netns', 'add', ns])
+        call(['sudo', 'ip', 'netns', 'exec', ns, 'ip', 'link', 'set', 'lo',
+              'up'])
+        call(['sudo', 'ip', 'netns', 'exec', ns, 'sysctl', '-q', '-w',
+              'net.ipv4.ip_forward=1'])
+
+
+def netns_command(lane, cmd):
+    # enter the lane's namespace as root, then drop back to this user
+    return (['sudo', 'ip', 'netns', 'exec', netns_name(lane),
+             'sudo', '-u', getpass.getuser(), 'env',
+             'HOME=%s' % path.expanduser('~'),
+             'PATH=%s' % os.environ.get('PATH', '')] + cmd)
+
+
+class LaneRunner(object):
+    """Runs independent commands side by side on this host.
+
+    Each lane is a network namespace of its own, so that the emulated
+    links and pantheon's tunnels of concurrent runs never share ports or
+    interfaces. A namespace has nothing but its loopback, which is enough
+    for pantheon's local mode, where both ends of a run are on this host;
+    with netns=False runs share the host's network instead. At most one
+    lane per cores_per_lane cores is used. The host's CPU load is
+    measured over every run from /proc/stat; a run during which it
+    exceeded max_load may have been slowed down by its neighbours, so one
+    lane is given up for the rest of the runs.
+
+    run() returns one record per command with its lane, exit code, wall
+    time, CPU time of the command and all its descendants (from
+    os.wait4) and the host load over the run.
+    """
+
+    def __init__(self, lanes, cores_per_lane=2, max_load=0.85, netns=True):
+        max_lanes = max(1, multiprocessing.cpu_count() / cores_per_lane)
+        self.lanes = max(1, min(lanes, max_lanes))
+        self.max_load = max_load
+        self.netns = netns
+
+        if self.lanes < lanes:
+            sys.stderr.write('lanes: %d cores allow only %d of %d lanes\n' % (
+                multiprocessing.cpu_count(), self.lanes, lanes))
+
+        if self.netns:
+            setup_netns(self.lanes)
+
+    def start(self, lane, cmd):
+        if self.netns:
+            cmd = netns_command(lane, cmd)
+        sys.stderr.write('+ [lane %d] %s\n' % (lane, ' '.join(cmd)))
+        return Popen(cmd)
+
+    def run(self, tasks, on_done=None):
+        # tasks are (name, cmd) pairs; on_done(record) is called as soon
+        # as each one exits
+        pending = list(reversed(tasks))
+        free_lanes = range(self.lanes - 1, -1, -1)
+        limit = self.lanes
+        running = {}
+        records = []
+
+        while pending or running:
+            while pending and len(running) < limit:
+                name, cmd = pending.pop()
+                lane = free_lanes.pop()
+                proc = self.start(lane, cmd)
+                running[proc.pid] = (lane, name, proc, time.time(),
+                                     cpu_times())
+
+            pid, status, rusage = os.wait4(-1, 0)
+            if pid not in running:
+                continue
+
+            lane, name, proc, start_ts, start_cpu = running.pop(pid)
+            free_lanes.append(lane)
+            if os.WIFSIGNALED(status):
+                proc.returncode = -os.WTERMSIG(status)
+            else:
+                proc.returncode = os.WEXITSTATUS(status)
+
+            record = {'name': name, 'lane': lane,
+                      'returncode': proc.returncode,
+                      'wall': time.time() - start_ts,
+                      'cpu': rusage.ru_utime + rusage.ru_stime,
+                      'host_load': busy_fraction(start_cpu, cpu_times()),
+                      'concurrent': len(running) + 1}
+            records.append(record)
+            sys.stderr.write(
+                'lane %(lane)d: %(name)s exited with %(returncode)s after '
+                '%(wall).2fs, cpu %(cpu).2fs, host load %(host_load).2f\n'
+                % record)
+
+            if record['host_load'] > self.max_load and limit > 1:
+                limit -= 1
+                sys.stderr.write('lanes: host load %.2f over %.2f, down to '
+                                 '%d lanes\n' % (record['host_load'],
+                                                 self.max_load, limit))
+
+            if on_done is not None:
+                on_done(record)
+
+        return records
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+import sys
+import numpy as np
+from os import path
+
+import datalink_log
+import scoring
+
+
+class LogCollector(object):
+    """Pulls the logs of every cell as soon as the cell is done.
+
+    collect() starts the copy right away; poll() summarizes whatever
+    copies have finished, so that transfers and parsing overlap with the
+    cells still running. finish() waits for the stragglers and returns
+    the same summary as scoring.summarize_experiment(logs_dir).
+
+    With summaries set, only the compact summaries written by
+    run_proxy.py --summarize are pulled; fetch_raw_logs() gets the full
+    logs later if they turn out to be needed.
+    """
+
+    def __init__(self, executor, logs_dir, schemes, run_times,
+                 summaries=False, tracer=None):
+        self.executor = executor
+        self.tracer = tracer
+        self.logs_dir = logs_dir
+        self.summaries = summaries
+        self.copies = []
+        self.hosts = {}
+        self.fetched = set()
+
+        self.summary = {}
+        for cc in schemes:
+            self.summary[cc] = np.empty((run_times, 2))
+            self.summary[cc].fill(np.nan)
+
+    def remote_logs(self, cc, run_id):
+        return '~/pantheon/test/%s*run%s.log' % (cc, run_id)
+
+    def remote_summary(self, cc, run_id):
+        return '~/pantheon/test/%s_datalink_run%s.summary.npz' % (cc, run_id)
+
+    def collect(self, host, run_id, cc):
+        self.hosts[(run_id, cc)] = host
+
+        if self.summaries:
+            remote_path = self.remote_summary(cc, run_id)
+        else:
+            remote_path = self.remote_logs(cc, run_id)
+
+        job = self.executor.spawn_copy(host, remote_path, self.logs_dir)
+        self.copies.append((job, run_id, cc))
+
+    def pending(self, host):
+        # copies still reading from host
+        return [job for job, _, _ in self.copies
+                if job.host == host and job.poll() is None]
+
+    def summarize(self, run_id, cc):
+        log_path = scoring.log_path(self.logs_dir, cc, run_id)
+
+        if self.summaries:
+            summary_path = scoring.summary_path(log_path)
+            if path.isfile(summary_path):
+                stats = scoring.read_log_summary(summary_path)
+                self.summary[cc][run_id - 1] = stats
+        elif path.isfile(log_path):
+            columns = datalink_log.load(log_path)
+            self.summary[cc][run_id - 1] = scoring.run_stats(columns)
+
+    def fetch_raw_logs(self):
+        if not self.summaries:
+            return
+
+        # runs fetched at an earlier rung are not copied again
+        runs = [(run, host) for run, host in sorted(self.hosts.items())
+                if run not in self.fetched]
+        host_paths = [(host, self.remote_logs(cc, run_id))
+                      for (run_id, cc), host in runs]
+        results = self.executor.copy_all(host_paths, self.logs_dir)
+        for (run, host), result in zip(runs, results):
+            if result.ok:
+                self.fetched.add(run)
+            else:
+                sys.stderr.write('Error: %s\n' % result.cmd)
+
+    def poll(self):
+        still_copying = []
+        for job, run_id, cc in self.copies:
+            if job.poll() is None:
+                still_copying.append((job, run_id, cc))
+            elif job.returncode != 0:
+                sys.stderr.write('Error: copying logs of %s run %s from %s '
+                                 'exited with %s\n' % (
+                                     cc, run_id, job.host, job.returncode))
+            else:
+                self.summarize(run_id, cc)
+
+            if self.tracer is not None and job.returncode is not None:
+                self.tracer.job('copy %s run%d' % (cc, run_id), job, 'copy',
+                                returncode=job.returncode)
+        self.copies = still_copying
+
+    def finish(self):
+        while self.copies:
+            self.copies[0][0].wait()
+            self.poll()
+
+        return self.summary
@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import glob
+import zlib
+import time
+import errno
+import random
+import signal
+import argparse
+import traceback
+import xmlrpclib
+from os import path
+from SimpleXMLRPCServer import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
+
+default_port = 8737
+
+# bytes of a file returned by one read(), so that a large log never holds
+# up the status() calls of running jobs for long
+read_size = 4 * 1024 ** 2
+
+# the only command cleanup() runs, after killing the agent's own jobs; the
+# bracketed patterns keep pkill from matching the shell running it
+cleanup_cmd = ('pkill -f [p]antheon; pkill -f [i]perf; pkill -f [m]m-link; '
+               'pkill -f [m]m-delay; pkill -f [m]m-loss; true')
+
+
+def close_inherited_fds():
+    # neither the listening socket nor the connection of the request may
+    # outlive the agent in a job
+    for fd in map(int, os.listdir('/proc/self/fd')):
+        if fd > 2:
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+
+class AgentJob(object):
+    def __init__(self, job_id, cmd, pid, output_path):
+        self.job_id = job_id
+        self.cmd = cmd
+        self.pid = pid
+        self.output_path = output_path
+        self.start_ts = time.time()
+        self.end_ts = None
+        self.returncode = None
+
+    def poll(self):
+        if self.returncode is None:
+            try:
+                pid, status = os.waitpid(self.pid, os.WNOHANG)
+            except OSError as e:
+                if e.errno != errno.ECHILD:
+                    raise
+                pid, status = self.pid, 0
+
+            if pid != 0:
+                if os.WIFSIGNALED(status):
+                    self.returncode = -os.WTERMSIG(status)
+                else:
+                    self.returncode = os.WEXITSTATUS(status)
+                self.end_ts = time.time()
+
+        return self.returncode
+
+    def kill(self):
+        if self.poll() is not None:
+            return False
+
+        # every job runs in its own session, so this also takes down
+        # pantheon, iperf and mahimahi processes it started
+        try:
+            os.killpg(self.pid, signal.SIGKILL)
+        except OSError:
+            pass
+        os.waitpid(self.pid, 0)
+        self.returncode = -signal.SIGKILL
+        self.end_ts = time.time()
+        return True
+
+
+class ProxyAgent(object):
+    """Long-lived runner of proxy commands, served over XML-RPC.
+
+    run() forks the already warm agent to call run_proxy.main() instead
+    of starting a new interpreter and returns a job id for status(),
+    which streams the job's output from a given offset, and cancel().
+    cleanup() kills every job it started, then runs cleanup_cmd.
+    fetch() lists the files matching a pattern and read() returns them
+    in compressed pieces, in place of scp.
+
+    The agent runs no other command and reads no file outside its root.
+    It has no authentication of its own: it listens on the loopback
+    interface and is reached through ssh port forwarding. Requests are
+    served one at a time, and every call returns quickly.
+    """
+
+    rpc_methods = ['ping', 'run', 'status', 'cancel', 'cleanup', 'fetch',
+                   'read']
+
+    def __init__(self, root):
+        self.root = root
+        self.jobs_dir = path.join(root, '.proxy_agent')
+        try:
+            os.makedirs(self.jobs_dir)
+        except OSError:
+            pass
+
+        self.real_root = path.realpath(root)
+        self.start_ts = time.time()
+        self.jobs = {}
+        self.next_job_id = 0
+
+        import run_proxy
+        self.run_proxy = run_proxy
+
+    def fork_job(self, cmd, child):
+        job_id = self.next_job_id
+        self.next_job_id += 1
+        output_path = path.join(self.jobs_dir, 'job%d.out' % job_id)
+
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                os.setsid()
+                fd = os.open(output_path,
+                             os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0644)
+                os.dup2(fd, 1)
+                os.dup2(fd, 2)
+                close_inherited_fds()
+                os.chdir(self.root)
+                # a fork shares the agent's random state, so unseeded runs
+                # would all draw the same numbers
+                random.seed()
+                code = child()
+            except SystemExit as e:
+                # like the interpreter: a message is printed and exits 1
+                if e.code is None or isinstance(e.code, int):
+                    code = e.code
+                else:
+                    sys.stderr.write('%s\n' % e.code)
+                    code = 1
+            except:
+                traceback.print_exc()
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(code or 0)
+
+        self.jobs[job_id] = AgentJob(job_id, cmd, pid, output_path)
+        self.forget_finished()
+        return job_id
+
+    def forget_finished(self, keep=1000):
+        finished = sorted(j for j, job in self.jobs.items()
+                          if job.poll() is not None)
+        for job_id in finished[:max(0, len(finished) - keep)]:
+            try:
+                os.remove(self.jobs[job_id].output_path)
+            except OSError:
+                pass
+            del self.jobs[job_id]
+
+    def ping(self):
+        return {'pid': os.getpid(), 'root': self.root,
+                'uptime': time.time() - self.start_ts,
+                'running': len([j for j in self.jobs.values()
+                                if j.poll() is None])}
+
+    def run(self, argv):
+        def child():
+            sys.argv = ['run_proxy.py'] + argv
+            self.run_proxy.main(argv)
+            return 0
+
+        return self.fork_job(['run_proxy.py'] + argv, child)
+
+    def status(self, job_id, offset=0):
+        job = self.jobs[job_id]
+        returncode = job.poll()
+
+        try:
+            with open(job.output_path, 'rb') as output_file:
+                output_file.seek(offset)
+                output = output_file.read()
+        except IOError:
+            output = ''
+
+        return {'returncode': returncode,
+                'elapsed': (job.end_ts or time.time()) - job.start_ts,
+                'output': xmlrpclib.Binary(output),
+                'offset': offset + len(output)}
+
+    def cancel(self, job_id):
+        return self.jobs[job_id].kill()
+
+    def cleanup(self):
+        killed = len([job for job in self.jobs.values() if job.kill()])
+        sys.stderr.write('cleanup: killed %d jobs\n' % killed)
+
+        def child():
+            os.execvp('sh', ['sh', '-c', cleanup_cmd])
+
+        return self.fork_job(cleanup_cmd, child)
+
+    def inside_root(self, file_path):
+        real_path = path.realpath(file_path)
+        return real_path.startswith(self.real_root + os.sep)
+
+    def fetch(self, pattern):
+        # [path, size] of the files matching pattern, ~ being the root
+        files = []
+        for file_path in sorted(glob.glob(path.expanduser(pattern))):
+            if self.inside_root(file_path) and path.isfile(file_path):
+                files.append([file_path, path.getsize(file_path)])
+        return files
+
+    def read(self, file_path, offset):
+        if not self.inside_root(file_path):
+            raise ValueError('%s is outside of %s' % (file_path, self.root))
+
+        with open(file_path, 'rb') as f:
+            f.seek(offset)
+            return xmlrpclib.Binary(zlib.compress(f.read(read_size), 1))
+
+
+class RequestHandler(SimpleXMLRPCRequestHandler):
+    rpc_paths = ('/RPC2',)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=default_port)
+    parser.add_argument('--bind', default='127.0.0.1',
+                        help='address to listen on; anyone who can reach '
+                        'it can run proxy commands (default 127.0.0.1, '
+                        'reached through ssh port forwarding)')
+    parser.add_argument('--root', help='home directory of this agent, '
+                        'containing pantheon/ (default: $HOME)')
+    args = parser.parse_args()
+
+    if args.root:
+        root = path.abspath(args.root)
+        try:
+            os.makedirs(root)
+        except OSError:
+            pass
+        # run_proxy and the fetched paths resolve ~ against the root
+        os.environ['HOME'] = root
+    else:
+        root = path.expanduser('~')
+
+    sys.path.insert(0, path.abspath(path.dirname(__file__)))
+    agent = ProxyAgent(root)
+
+    server = SimpleXMLRPCServer((args.bind, args.port),
+                                requestHandler=RequestHandler,
+                                allow_none=True, logRequests=False)
+    for name in agent.rpc_methods:
+        server.register_function(getattr(agent, name), name)
+    sys.stderr.write('proxy agent listening on %s:%d, root %s\n' % (
+        args.bind, args.port, root))
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -5,10 +5,20 @@ import sys
 import time
 import json
 import shutil
-import argparse
 from os import path
-from subprocess import Popen, check_output, check_call
+from subprocess import check_output
 import math
+from remote_exec import SshExecutor, AgentExecutor, DeferredJob
+from scheduler import Scheduler, median
+from eval_cache import EvalCache, emulation_params
+import scoring
+from log_collector import LogCollector
+from fidelity import (SuccessiveHalving, SequentialStopping,
+                      format_fidelity, sequential_rungs)
+from search_log import SearchLog, evaluation_key
+from result_store import ResultStore
+from tracing import Tracer, format_summary
+from proxy_agent import cleanup_cmd
 local_pantheon = path.expanduser('~/pantheon')
 local_test_dir = path.join(local_pantheon, 'test')
 local_analyze_dir = path.join(local_pantheon, 'analyze')
@@ -29,38 +39,14 @@ def create_empty_directory(dir_path):
         pass
 
 
-def copy_logs(args, ip_dict):
-    logs_dir = path.join(local_replication_dir, 'candidate_results')
-    create_empty_directory(logs_dir)
-
-    copy_procs = []
-    for ip in args['ips']:
-        if ip not in ip_dict:
-            continue
-
-        run_id = ip_dict[ip][0]
-        cc = ip_dict[ip][1]
-
-        logs_to_copy = '%s*run%s.log' % (cc, run_id)
-        logs_to_copy = 'ubuntu@%s:~/pantheon/test/%s' % (ip, logs_to_copy)
-        cmd = 'scp %s %s' % (logs_to_copy, logs_dir)
-        sys.stderr.write('+ %s\n' % cmd)
-        copy_procs.append(Popen(cmd, shell=True))
-
-    for proc in copy_procs:
-        proc.wait()
-
-    return logs_dir
-
-
 def create_metadata_file(args, logs_dir):
     metadata = {}
     metadata['cc_schemes'] = ' '.join(args['schemes'])
-    metadata['runtime'] = 30
+    metadata['runtime'] = args['runtime']
     metadata['flows'] = 1
     metadata['interval'] = 0
     metadata['sender_side'] = 'local'
-    metadata['run_times'] = 10
+    metadata['run_times'] = args['run_times']
 
     metadata_path = path.join(logs_dir, 'pantheon_metadata.json')
     with open(metadata_path, 'w') as metadata_file:
@@ -68,6 +54,10 @@ def create_metadata_file(args, logs_dir):
 
 
 def get_best_score(args, score_name):
+    search_log = args.get('search_log')
+    if search_log is not None and len(search_log) > 0:
+        return search_log.best_score(score_name[len('best_'):])
+
     if score_name == 'best_tput_median_score':
         dir_name = args['location'] + 'best_tput_median_results'
         search_str = 'Average median throughput difference'
@@ -101,7 +91,31 @@ def get_best_score(args, score_name):
     return best_score
 
 
-def replication_score(args, logs_dir):
+def replication_score(args, logs_dir, emu_summary=None):
+    if not args['native_scoring']:
+        return pantheon_replication_score(args, logs_dir)
+
+    if emu_summary is None:
+        emu_summary = scoring.summarize_experiment(logs_dir, args['schemes'])
+    result = scoring.score_summary(args['replicate'], emu_summary,
+                                   args['schemes'])
+    results = scoring.format_result(result, args['schemes'])
+
+    result_path = path.join(logs_dir, 'comparison_result')
+    with open(result_path, 'w') as result_file:
+        result_file.write(results)
+
+    float_scores = list(scoring.scores_tuple(result))
+    sys.stderr.write('scores: %.2f%% %.2f%% %.2f%%\n' % tuple(float_scores))
+
+    for i in range(0, 3):
+        if math.isnan(float_scores[i]):
+            float_scores[i] = 10000.0
+
+    return tuple(float_scores)
+
+
+def pantheon_replication_score(args, logs_dir):
     compare_src = path.join(local_analyze_dir, 'compare_two_experiments.py')
     real_logs = args['replicate']
     cmd = ['python', compare_src, real_logs, logs_dir, '--analyze-schemes',
@@ -129,120 +143,457 @@ def replication_score(args, logs_dir):
     return tuple(float_scores)
 
 
-def save_best_results(logs_dir, dst_dir):
-    try:
-        shutil.rmtree(dst_dir)
-    except:
-        pass
+def best_results_dir(args, score_name):
+    return path.join(local_replication_dir, args['location'] +
+                     score_name[:-len('_score')] + '_results')
+
 
-    cmd = 'cp -r %s %s' % (logs_dir, dst_dir)
-    check_call(cmd, shell=True)
+def save_best_results(args, candidate_id, score_name):
+    # the best results directory is a symlink into the result store, so
+    # a new best only moves the link
+    args['result_store'].point(best_results_dir(args, score_name),
+                               candidate_id)
 
 
 def serialize(args, scores):
-    return ('bandwidth=%.2f,delay=%d,uplink_queue=%d,uplink_loss=%.4f,'
-            'downlink_loss=%.4f,tput_median_score=%s,delay_median_score=%s,'
-            'overall_median_score=%s,time=%.2fmin\n'
-            % (args['bandwidth'][0],
-               args['delay'][0],
-               args['uplink_queue'][0],
-               args['uplink_loss'][0],
-               args['downlink_loss'][0],
-               scores[0], scores[1], scores[2],
-               (time.time() - start_time) / 60.0))
+    if 'fidelity' in args:
+        fidelity = args['fidelity']
+    else:
+        fidelity = format_fidelity(args['run_times'], args['runtime'])
+
+    record = dict((name, list(args[name])) for name in emulation_params)
+    record['tput_median_score'] = scores[0]
+    record['delay_median_score'] = scores[1]
+    record['overall_median_score'] = scores[2]
+    record['fidelity'] = fidelity
+    record['full_fidelity'] = args.get('full_fidelity', True)
+    if 'objective' in args:
+        record['objective'] = args['objective']
+    # no rungs ran for a score from the eval cache
+    record['rung_scores'] = args.get('rung_scores', [])
+    record['key'] = evaluation_key(args)
+    record['runs'] = args.get('runs', args['run_times'])
+    if 'ci' in args:
+        record['ci'] = args['ci']
+        record['ci_width'] = args['ci'][1] - args['ci'][0]
+        record['stop'] = args['stop']
+    if 'result_id' in args:
+        record['result'] = args['result_id']
+    if 'job_id' in args:
+        record['job_id'] = args['job_id']
+    record['time'] = (time.time() - start_time) / 60.0
+    record['created'] = time.time()
+    return record
+
+
+def report_failures(results):
+    for result in results:
+        if not result.ok:
+            sys.stderr.write('Error: %s exited with %s after %.2fs: %s\n' %
+                             (result.host, result.returncode,
+                              result.elapsed, result.cmd))
+
+    return results
+
+
+# kill all pantheon and iperf processes on a proxy; the same command the
+# proxy agents run on cleanup
+pkill_cmd = cleanup_cmd
+
+# scores of a candidate whose runs could not all be done, as bad as those
+# of a run without any throughput
+failed_scores = (10000.0, 10000.0, 10000.0)
+
+
+def record_speculation(args, scheduler):
+    report = scheduler.speculation_report()
+    if not report:
+        return
+
+    lines = []
+    for spec in report:
+        lines.append(
+            'candidate=%s,run_id=%s,scheme=%s,original=%s,'
+            'original_status=%s,original_time=%.2fs,duplicate=%s,'
+            'duplicate_status=%s,duplicate_time=%.2fs\n'
+            % (spec['cell'][0], spec['cell'][1],
+               spec['cell'][2].replace(',', '+'),
+               spec['original_host'], spec['original_status'],
+               spec['original_elapsed'], spec['duplicate_host'],
+               spec['duplicate_status'], spec['duplicate_elapsed']))
+
+    won = [s for s in report if s['duplicate_status'] == 'ok']
+    sys.stderr.write('speculation: %d cells duplicated, %d won by the '
+                     'duplicate, median cell %.2fs\n' % (
+                         len(report), len(won),
+                         median(scheduler.durations)))
+
+    with open(args['location'] + 'speculation_log', 'a') as spec_log:
+        spec_log.writelines(lines)
 
 
 def clean_up_processes(args):
-    # kill all pantheon and iperf processes on proxies
-    setup_procs = []
-    for ip in args['ips']:
-        ssh_cmd = ['ssh', 'ubuntu@%s' % ip]
-
-        cmd = ssh_cmd + [
-                'pkill -f pantheon; pkill -f iperf; pkill -f mm-link; '
-                'pkill -f mm-delay; pkill -f mm-loss']
-        sys.stderr.write('+ %s\n' % ' '.join(cmd))
-        setup_procs.append(Popen(cmd))
-
-    for proc in setup_procs:
-        proc.wait()
-
-
-def run_experiment(args):
-    if args['pkill']:
-        clean_up_processes(args)
+    executor = args['executor']
+    launchers = [lambda ip=ip: executor.spawn_cleanup(ip, pkill_cmd)
+                 for ip in args['ips']]
+    return executor.wait_all(launchers)
 
-    run_proxy = '~/replication_with_emulation/run_proxy.py'
-
-    proxy_procs = []
-    ip_dict = {}
 
+def proxy_params(args):
     params = []
     params += ['--bandwidth', ','.join(map(str, args['bandwidth']))]
     params += ['--delay', ','.join(map(str, args['delay']))]
     params += ['--uplink-queue', ','.join(map(str, args['uplink_queue']))]
     params += ['--uplink-loss', ','.join(map(str, args['uplink_loss']))]
     params += ['--downlink-loss', ','.join(map(str, args['downlink_loss']))]
+    return params
 
-    ip_index = 0
-    for run_id in xrange(1, 11):
-        for cc in args['schemes']:
-            ip = args['ips'][ip_index]
-            ip_index = ip_index + 1
-            ip_dict[ip] = (run_id, cc)
 
-            ssh_cmd = ['ssh', 'ubuntu@%s' % ip]
-            cmd = ssh_cmd + ['python', run_proxy] + params
-            cmd += ['--run-id', '%s,%s' % (run_id, run_id)]
-            cmd += ['--schemes %s' % cc]
+def candidate_logs_dir(index):
+    if index == 0:
+        return path.join(local_replication_dir, 'candidate_results')
+    return path.join(local_replication_dir, 'candidate_results_%d' % index)
 
-            sys.stderr.write('+ %s\n' % ' '.join(cmd))
-            proxy_procs.append(Popen(cmd))
 
-    for proc in proxy_procs:
-        proc.wait()
+def record_result(args, candidate_args, logs_dir, scores, collector):
+    # every candidate is kept in the result store; only a new best needs
+    # its raw logs. scores are measured at the candidate's last rung, and
+    # only a score measured at full fidelity can be a new best
+    tracer = args['tracer']
+    new_best = candidate_args.get('full_fidelity', True) and \
+        scores[2] < args['best_overall_median_score']
+    if new_best:
+        args['best_overall_median_score'] = scores[2]
+        with tracer.span('fetch_raw_logs'):
+            collector.fetch_raw_logs()
 
-    logs_dir = copy_logs(args, ip_dict)
-    create_metadata_file(args, logs_dir)
-    scores = replication_score(args, logs_dir)
+    with tracer.span('save_results'):
+        store = args['result_store']
+        candidate_args['result_id'] = store.add(logs_dir)
+        if new_best:
+            save_best_results(args, candidate_args['result_id'],
+                              'best_overall_median_score')
+        store.gc()
 
     if 'search_log' in args:
-        args['search_log'].write(serialize(args, scores))
+        args['search_log'].append(serialize(candidate_args, scores))
+
+
+def completed_scores(args, candidate_args):
+    # a candidate already in the search log was evaluated before a crash
+    # or restart; the optimizer gets its logged scores again, as long as
+    # they are no older than the eval cache keeps scores
+    if 'search_log' not in args:
+        return None
+
+    cache = args.get('eval_cache')
+    record = args['search_log'].completed(
+        candidate_args, ttl=cache.ttl if cache is not None else None)
+    if record is None:
+        return None
+
+    sys.stderr.write('already evaluated: %s\n' % record['key'])
+    return (record['tput_median_score'], record['delay_median_score'],
+            record.get('objective', record['overall_median_score']))
+
+
+def run_candidates(args, candidates):
+    # candidates are dicts of emulation parameters overriding args;
+    # candidates quantizing to an already evaluated configuration are
+    # answered from the evaluation cache without touching the proxies
+    candidate_args = [dict(args, **candidate) for candidate in candidates]
+    all_scores = [completed_scores(args, cand_args)
+                  for cand_args in candidate_args]
+    cache = args.get('eval_cache')
+
+    to_evaluate = {}
+    for index, cand_args in enumerate(candidate_args):
+        if all_scores[index] is not None:
+            continue
 
-    if scores[2] < args['best_overall_median_score']:
-        args['best_overall_median_score'] = scores[2]
-        save_best_results(logs_dir, path.join(
-            local_replication_dir,
-            args['location'] + 'best_overall_median_results'))
+        if cache is None:
+            to_evaluate[index] = [index]
+            continue
+
+        scores = cache.get(cand_args)
+        if scores is not None:
+            sys.stderr.write('eval cache hit: %s\n' % json.dumps(
+                serialize(cand_args, scores)))
+            all_scores[index] = scores
+            if 'search_log' in args:
+                args['search_log'].append(serialize(cand_args, scores))
+        else:
+            to_evaluate.setdefault(cache.key(cand_args), []).append(index)
+
+    if to_evaluate:
+        keys = to_evaluate.keys()
+        evaluated = evaluate_candidates(
+            args, [candidate_args[to_evaluate[key][0]] for key in keys])
+
+        for key, scores in zip(keys, evaluated):
+            # a score extrapolated from a lower fidelity is not cached
+            cand_args = candidate_args[to_evaluate[key][0]]
+            if cache is not None and cand_args.get('full_fidelity'):
+                cache.put(cand_args, scores)
+            for index in to_evaluate[key]:
+                all_scores[index] = scores
+
+    if cache is not None:
+        cache.save()
+        sys.stderr.write('%s\n' % cache.stats())
+    return all_scores
+
+
+def trace_cells(tracer, scheduler, cleanups):
+    # every attempt of a cell and every cleanup, on the track of its proxy
+    for attempt in scheduler.attempts:
+        index, run_id, cc = attempt.cell
+        tracer.job('%s run%d' % (cc, run_id), attempt.job, 'cell',
+                   candidate=index, status=attempt.status,
+                   speculative=attempt.speculative)
+
+    for job in cleanups:
+        tracer.job('cleanup', job, 'cleanup')
+    del cleanups[:]
+
+
+def evaluate_candidates(args, candidate_args):
+    # at every rung the proxies are split into one partition per
+    # candidate still active so that their logs never overwrite each
+    # other on a proxy; later rungs use new run ids, so a proxy that
+    # changes hands never holds two logs of the same name
+    if len(candidate_args) > len(args['ips']):
+        sys.exit('Error: %d candidates but only %d proxies' %
+                 (len(candidate_args), len(args['ips'])))
+    if args['sequential'] and not args['native_scoring']:
+        sys.exit('Error: sequential stopping needs native scoring')
+
+    tracer = args['tracer']
+    if args['pkill']:
+        with tracer.span('pkill'):
+            clean_up_processes(args)
+
+    executor = args['executor']
+
+    params = [proxy_params(cand_args) for cand_args in candidate_args]
+    partition = {}
+    rungs = args['fidelities']
+    # rungs from full_rung on run at full fidelity: the last rung, or the
+    # waves that replace it with sequential stopping
+    full_rung = len(rungs) - 1
+    if args['sequential']:
+        rungs = sequential_rungs(rungs, args['run_wave'])
+        stopping = SequentialStopping(args['max_ci_width'])
+        real_summary = scoring.cached_summary(args['replicate'],
+                                              args['schemes'])
+    halving = SuccessiveHalving(
+        rungs, args['search_log'].records() if 'search_log' in args else [],
+        promote_quantile=args['promote_quantile'], full_rung=full_rung)
+
+    runtime = [None]
+
+    # with lanes, a cell is a group of schemes that one proxy runs side
+    # by side
+    lanes = args['lanes']
+    scheme_groups = [','.join(args['schemes'][i:i + lanes])
+                     for i in xrange(0, len(args['schemes']), lanes)]
+
+    def launch(ip, cell):
+        index, run_id, group = cell
+        cmd = params[index] + ['--run-id', '%s,%s' % (run_id, run_id)]
+        cmd += ['--schemes', group]
+        cmd += ['--runtime', str(runtime[0])]
+        if lanes > 1:
+            cmd += ['--lanes', str(len(group.split(',')))]
+        if args['seed'] is not None:
+            cmd += ['--seed', str(args['seed'])]
+            cmd += ['--sampling', args['sampling']]
+            cmd += ['--total-runs', str(rungs[-1][0])]
+        if args['host_summaries']:
+            cmd += ['--summarize']
+        # nested in the cells phase: the master's side of starting a cell,
+        # kept out of the phase totals
+        with tracer.span('launch', cat='subphase'):
+            return executor.spawn_proxy(ip, cmd)
+
+    cleanups = []
+
+    def cleanup(ip):
+        # the cleanup would also kill the copies of earlier cells still
+        # streaming from the proxy, so it waits for them
+        copies = [job for collector in collectors if collector is not None
+                  for job in collector.pending(ip)]
+        if copies:
+            cleanups.append(DeferredJob(
+                ip, copies, lambda: executor.spawn_cleanup(ip, pkill_cmd)))
+        else:
+            cleanups.append(executor.spawn_cleanup(ip, pkill_cmd))
+        return cleanups[-1]
+
+    def affinity(ip, cell):
+        return partition[ip] == cell[0]
+
+    logs_dirs = [candidate_logs_dir(index)
+                 for index in xrange(len(candidate_args))]
+    collectors = [None] * len(candidate_args)
+    runs_done = [0] * len(candidate_args)
+    rung_scores = [[] for _ in candidate_args]
+
+    # logs are pulled and summarized as soon as each cell is done
+    def on_success(attempt):
+        index, run_id, group = attempt.cell
+        for cc in group.split(','):
+            collectors[index].collect(attempt.host, run_id, cc)
+
+    def on_poll():
+        for index in active:
+            collectors[index].poll()
+
+    # every candidate starts at the lowest fidelity; after each rung only
+    # the promising ones go on to more (or longer) runs
+    all_scores = [None] * len(candidate_args)
+    active = range(len(candidate_args))
+    for rung, (run_times, rung_runtime) in enumerate(rungs):
+        cells = []
+        for index in active:
+            rung_args = dict(candidate_args[index], run_times=run_times,
+                             runtime=rung_runtime)
+
+            if rung_runtime != runtime[0]:
+                # runs of another length cannot be reused
+                create_empty_directory(logs_dirs[index])
+                collectors[index] = LogCollector(
+                    executor, logs_dirs[index], args['schemes'],
+                    rungs[-1][0], summaries=args['host_summaries'],
+                    tracer=tracer)
+                runs_done[index] = 0
+
+            create_metadata_file(rung_args, logs_dirs[index])
+            cells += [(index, run_id, group)
+                      for run_id in xrange(runs_done[index] + 1,
+                                           run_times + 1)
+                      for group in scheme_groups]
+            runs_done[index] = run_times
+        runtime[0] = rung_runtime
+
+        # proxies of the candidates stopped so far go to the others
+        partition.clear()
+        partition.update((ip, active[i % len(active)])
+                         for i, ip in enumerate(args['ips']))
+
+        # every (run_id, schemes) cell is pulled by whichever proxy of the
+        # candidate's partition is free
+        scheduler = Scheduler(args['ips'], launch, cleanup=cleanup,
+                              timeout=args['cell_timeout'],
+                              max_attempts=args['max_attempts'],
+                              affinity=affinity, speculate=args['speculate'])
+        with tracer.span('cells', rung=rung, cells=len(cells)):
+            scheduler.run(cells, on_success=on_success, on_poll=on_poll)
+        record_speculation(args, scheduler)
+        trace_cells(tracer, scheduler, cleanups)
+        lost = {}
+        for cell in scheduler.failed:
+            lost[cell[0]] = lost.get(cell[0], 0) + 1
+
+        promoted = []
+        for index in active:
+            cand_args = candidate_args[index]
+            logs_dir = logs_dirs[index]
+
+            with tracer.span('collect', candidate=index):
+                emu_summary = collectors[index].finish()
+                if not args['native_scoring'] and index not in lost:
+                    collectors[index].fetch_raw_logs()
+
+            # a score over fewer runs than the rung asks for is neither
+            # comparable nor reusable; the optimizer gets the penalty
+            if index in lost:
+                sys.stderr.write('Error: candidate %d lost %d cells, not '
+                                 'scored\n' % (index, lost[index]))
+                cand_args['full_fidelity'] = False
+                all_scores[index] = failed_scores
+                continue
+            with tracer.span('scoring', candidate=index):
+                scores = replication_score(cand_args, logs_dir, emu_summary)
+            rung_scores[index].append(scores[2])
+            best_score = args['best_overall_median_score']
+
+            # runs of the last rung are added wave by wave until the
+            # score is known precisely enough; earlier rungs are halved
+            wave = args['sequential'] and rung >= full_rung
+            if wave:
+                with tracer.span('bootstrap', candidate=index):
+                    ci = scoring.confidence_interval(
+                        scoring.bootstrap_scores(
+                            real_summary, emu_summary,
+                            args['schemes'])[:, 2], args['confidence'])
+                stop = stopping.stop_reason(ci, best_score, run_times)
+                if stop is None and rung + 1 < len(rungs):
+                    promoted.append(index)
+                    continue
+            elif halving.should_promote(rung, scores[2], best_score):
+                promoted.append(index)
+                continue
+
+            cand_args['fidelity'] = format_fidelity(run_times, rung_runtime)
+            cand_args['full_fidelity'] = rung >= full_rung
+            cand_args['runs'] = run_times
+            cand_args['rung_scores'] = rung_scores[index]
+            if wave:
+                cand_args['ci'] = list(ci)
+                cand_args['stop'] = stop or 'max runs'
+                sys.stderr.write(
+                    'candidate %d: %d runs, score %.2f, %d%% CI %.2f-%.2f '
+                    '(width %.2f), %s\n' % (
+                        index, run_times, scores[2],
+                        args['confidence'] * 100, ci[0], ci[1],
+                        ci[1] - ci[0], cand_args['stop']))
+            elif not cand_args['full_fidelity']:
+                # the optimizer gets the score extrapolated to full
+                # fidelity; the log and the best results keep the measured
+                # one
+                cand_args['objective'] = halving.noise_aware_score(
+                    rung, scores[2])
+            halving.record(rung_scores[index])
+
+            record_result(args, cand_args, logs_dir, scores,
+                          collectors[index])
+            all_scores[index] = (scores[0], scores[1],
+                                 cand_args.get('objective', scores[2]))
+        active = promoted
+        if not active:
+            break
 
-    return scores
+    return all_scores
 
-def setup_replication(args):
-    setup_procs = []
-    for ip in args['ips']:
-        ssh_cmd = ['ssh', 'ubuntu@%s' % ip]
 
-        cmd = ssh_cmd + ['cd ~/replication_with_emulation && '
-                         'git checkout bayes_entropy && git pull']
-        sys.stderr.write('+ %s\n' % ' '.join(cmd))
-        setup_procs.append(Popen(cmd))
+def run_experiment(args):
+    return run_candidates(args, [{}])[0]
+
 
-    for proc in setup_procs:
-        proc.wait()
+def setup_replication(args):
+    cmd = ('cd ~/replication_with_emulation && '
+           'git checkout bayes_entropy && git pull')
+    return report_failures(
+        args['executor'].run_all([(ip, cmd) for ip in args['ips']]))
 
 
 def setup_pantheon(args):
-    setup_procs = []
-    for ip in args['ips']:
-        ssh_cmd = ['ssh', 'ubuntu@%s' % ip]
+    cmd = ('cd ~/pantheon/test && git checkout master && '
+           'git pull && ./run.py --run-only setup')
+    return report_failures(
+        args['executor'].run_all([(ip, cmd) for ip in args['ips']]))
 
-        cmd = ssh_cmd + ['cd ~/pantheon/test && git checkout master && '
-                         'git pull && ./run.py --run-only setup']
-        sys.stderr.write('+ %s\n' % ' '.join(cmd))
-        setup_procs.append(Popen(cmd))
 
-    for proc in setup_procs:
-        proc.wait()
+def setup_agents(args):
+    # start proxy_agent.py on every proxy unless it is already running;
+    # it stays up across jobs of the search
+    cmd = ('cd ~/replication_with_emulation && '
+           'pgrep -f "[p]roxy_agent.py" > /dev/null || '
+           '(nohup python proxy_agent.py > ~/proxy_agent.log 2>&1 '
+           '< /dev/null &)')
+    return report_failures(SshExecutor(user='ubuntu').run_all(
+        [(ip, cmd) for ip in args['ips']]))
 
 
 def get_args():
@@ -255,10 +606,89 @@ def get_args():
     content = [x.strip() for x in content]
     args['ips'] = content
 
+    # ssh master connections are kept open across jobs of the search;
+    # with use_agents, cells are run by proxy_agent.py on every proxy,
+    # started by setup_agents and reached through ssh tunnels, instead of
+    # a new ssh session per cell
+    args['use_agents'] = False
+    if args['use_agents']:
+        setup_agents(args)
+        args['executor'] = AgentExecutor(user='ubuntu', max_concurrency=128)
+        report_failures(args['executor'].start(args['ips']))
+    else:
+        args['executor'] = SshExecutor(user='ubuntu', max_concurrency=128)
+
+    # schemes a proxy runs at once, each in its own network namespace;
+    # with more lanes the same cells need fewer proxies
+    args['lanes'] = 1
+
     args['max_iters'] = 1
+    args['run_times'] = 10
+    args['runtime'] = 30
+
+    # (run_times, runtime) rungs of successive halving; a candidate only
+    # moves on to the next rung if it ranks in the top promote_quantile
+    # of the search log at the current one
+    args['fidelities'] = [(3, 30), (args['run_times'], args['runtime'])]
+    args['promote_quantile'] = 1.0 / 3
+
+    # score in-process instead of running pantheon's compare_two_experiments;
+    # off until bench/bench_scoring.py shows the two agree on real logs
+    args['native_scoring'] = False
+
+    # sequential stopping: the runs of the last rung are added in waves of
+    # run_wave, and a candidate stops once the bootstrap confidence
+    # interval of its score is narrower than max_ci_width points or lies
+    # entirely above the best score. Earlier rungs still go through
+    # successive halving, so only candidates promoted past them get waves.
+    # The intervals are bootstrapped in-process, so they are only on the
+    # same scale as the scores with native scoring
+    args['sequential'] = args['native_scoring']
+    args['run_wave'] = 2
+    args['max_ci_width'] = 5.0
+    args['confidence'] = 0.9
+
+    # run i of every candidate draws its parameters and trace from the
+    # same stream (common random numbers), and the runs follow a Sobol
+    # design; None draws fresh random numbers on every run
+    args['seed'] = 1
+    args['sampling'] = 'sobol'
+
+    # seconds before a cell is killed and put back on the queue
+    args['cell_timeout'] = 600
+    args['max_attempts'] = 3
+
+    # duplicate cells that run far longer than the median on idle proxies
+    args['speculate'] = True
     args['replicate'] = '2016-12-30T21-38-China-ppp0-to-AWS-Korea-10-runs-logs'
     args['location'] = 'china_entropy_spearmint_'
 
+    # proxies reduce their logs to compact summaries; raw logs are only
+    # pulled for a new best. Pantheon's scoring needs the raw logs of
+    # every run anyway, so they are streamed instead
+    args['host_summaries'] = args['native_scoring']
+
+    # reuse scores of candidates that quantize to an evaluated configuration
+    args['eval_cache'] = EvalCache(args['location'] + 'eval_cache.json',
+                                   ttl=7 * 24 * 3600, max_entries=10000)
+
+    # every evaluated candidate, deduplicated by content; the best results
+    # directories point into it
+    args['result_store'] = ResultStore(
+        path.join(local_replication_dir, args['location'] + 'results'),
+        keep=200, max_bytes=20 * 1024 ** 3,
+        pointers=[best_results_dir(args, 'best_overall_median_score')])
+
+    # JSONL log of every evaluation; the old key=value log is imported
+    # the first time
+    args['search_log'] = SearchLog(args['location'] + 'search_log.jsonl',
+                                   legacy_path=args['location'] +
+                                   'search_log')
+
+    # Chrome trace of the phases of every iteration, and of every cell on
+    # every proxy
+    args['tracer'] = Tracer(args['location'] + 'trace.json')
+
     args['best_overall_median_score'] = get_best_score(
             args, 'best_overall_median_score')
 
@@ -269,12 +699,7 @@ def get_args():
     return args
 
 
-def main(job_id, params):
-    args = get_args()
-
-    search_log = open(args['location'] + 'search_log', 'a', 0)
-    args['search_log'] = search_log
-
+def unit_to_candidate(params):
     unit_vars = []
     unit_vars.append(params['bandwidth'][0])
     unit_vars.append(params['delay'][0])
@@ -314,15 +739,44 @@ def main(job_id, params):
 
         real_x.append(x)
 
-    args['bandwidth'] = (real_x[0], 0)
-    args['delay'] = (int(math.ceil(real_x[1])), 0)
-    args['uplink_queue'] = (int(math.ceil(real_x[2])), 0)
-    args['uplink_loss'] = (real_x[3], 0)
-    args['downlink_loss'] = (real_x[4], 0)
+    candidate = {}
+    candidate['bandwidth'] = (real_x[0], 0)
+    candidate['delay'] = (int(math.ceil(real_x[1])), 0)
+    candidate['uplink_queue'] = (int(math.ceil(real_x[2])), 0)
+    candidate['uplink_loss'] = (real_x[3], 0)
+    candidate['downlink_loss'] = (real_x[4], 0)
 
-    scores = run_experiment(args)
+    return candidate, entropy
 
-    ret = scores[2] + entropy
 
-    search_log.close()
-    return ret
+def main_batch(job_id, params_list):
+    # evaluate several Spearmint proposals concurrently, one partition
+    # of the proxies each, and return one objective value per proposal
+    args = get_args()
+    args['job_id'] = job_id
+
+    candidates = []
+    entropies = []
+    for params in params_list:
+        candidate, entropy = unit_to_candidate(params)
+        candidates.append(candidate)
+        entropies.append(entropy)
+
+    start_ts = time.time()
+    all_scores = run_candidates(args, candidates)
+
+    tracer = args['tracer']
+    phases = tracer.summary()
+    tracer.complete('iteration', start_ts, time.time(), cat='iteration',
+                    args={'job_id': job_id, 'candidates': len(candidates),
+                          'phases': phases})
+    tracer.flush()
+    sys.stderr.write('%s\n' % format_summary(phases))
+
+    args['search_log'].close()
+    return [scores[2] + entropy
+            for scores, entropy in zip(all_scores, entropies)]
+
+
+def main(job_id, params):
+    return main_batch(job_id, [params])[0]
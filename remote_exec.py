@@ -0,0 +1,597 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import time
+import zlib
+import socket
+import tempfile
+import threading
+import xmlrpclib
+from os import path
+from subprocess import Popen
+from proxy_agent import default_port
+
+run_proxy_path = '~/replication_with_emulation/run_proxy.py'
+
+
+class Result(object):
+    def __init__(self, host, cmd, returncode, start_ts, end_ts,
+                 cancelled=False):
+        self.host = host
+        self.cmd = cmd
+        self.returncode = returncode
+        self.start_ts = start_ts
+        self.end_ts = end_ts
+        self.cancelled = cancelled
+
+    @property
+    def elapsed(self):
+        return self.end_ts - self.start_ts
+
+    @property
+    def ok(self):
+        return self.returncode == 0 and not self.cancelled
+
+    def __repr__(self):
+        return 'Result(host=%s, returncode=%s, elapsed=%.2fs%s)' % (
+            self.host, self.returncode, self.elapsed,
+            ', cancelled' if self.cancelled else '')
+
+
+class Job(object):
+    """A command started on a host; polled without blocking."""
+
+    def __init__(self, host, cmd, proc):
+        self.host = host
+        self.cmd = cmd
+        self.proc = proc
+        self.start_ts = time.time()
+        self.end_ts = None
+        self.returncode = None
+        self.cancelled = False
+
+    def poll(self):
+        if self.returncode is None:
+            ret = self.proc.poll()
+            if ret is not None:
+                self.returncode = ret
+                self.end_ts = time.time()
+
+        return self.returncode
+
+    def done(self):
+        return self.poll() is not None
+
+    def elapsed(self):
+        end_ts = self.end_ts if self.end_ts is not None else time.time()
+        return end_ts - self.start_ts
+
+    def cancel(self):
+        if self.poll() is not None:
+            return
+
+        try:
+            self.proc.kill()
+        except OSError:
+            pass
+
+        self.returncode = self.proc.wait()
+        self.end_ts = time.time()
+        self.cancelled = True
+
+    def wait(self):
+        while self.poll() is None:
+            time.sleep(0.05)
+        return self.returncode
+
+    def result(self):
+        return Result(self.host, self.cmd, self.returncode,
+                      self.start_ts, self.end_ts, self.cancelled)
+
+
+class DeferredJob(Job):
+    """A job started by start() only once every job in after is done,
+    e.g. a cleanup that must not kill copies still reading from its host.
+    Its elapsed time includes the wait."""
+
+    def __init__(self, host, after, start):
+        super(DeferredJob, self).__init__(host, 'deferred', None)
+        self.after = after
+        self.start = start
+        self.job = None
+
+    def poll(self):
+        if self.returncode is not None:
+            return self.returncode
+
+        if self.job is None:
+            if [job for job in self.after if job.poll() is None]:
+                return None
+            self.job = self.start()
+            self.cmd = self.job.cmd
+
+        if self.job.poll() is not None:
+            self.returncode = self.job.returncode
+            self.end_ts = time.time()
+        return self.returncode
+
+    def cancel(self):
+        if self.poll() is not None:
+            return
+
+        if self.job is not None:
+            self.job.cancel()
+            self.returncode = self.job.returncode
+        else:
+            self.returncode = -9
+        self.end_ts = time.time()
+        self.cancelled = True
+
+
+class Executor(object):
+    """Runs shell commands on a set of hosts.
+
+    Jobs are plain subprocesses polled from a single loop. wait_all(),
+    and run_all() and copy_all() with it, keep at most max_concurrency
+    of them alive at any time no matter how many hosts are given.
+    spawn(), spawn_proxy() and spawn_copy() start a job right away and
+    are not limited; the Scheduler bounds its cells by its hosts, and a
+    LogCollector starts one copy per finished cell. Subclasses only
+    decide how a command is wrapped.
+    """
+
+    def __init__(self, max_concurrency=64, poll_interval=0.05):
+        self.max_concurrency = max_concurrency
+        self.poll_interval = poll_interval
+
+    def command(self, host, cmd):
+        raise NotImplementedError
+
+    def copy_command(self, host, remote_path, local_dir):
+        raise NotImplementedError
+
+    def start(self, hosts):
+        pass
+
+    def close(self):
+        pass
+
+    def spawn(self, host, cmd):
+        if not isinstance(cmd, basestring):
+            cmd = ' '.join(cmd)
+
+        argv = self.command(host, cmd)
+        sys.stderr.write('+ %s\n' % ' '.join(argv))
+        return Job(host, cmd, Popen(argv, env=self.environ(host)))
+
+    def spawn_proxy(self, host, argv):
+        return self.spawn(host, ['python', run_proxy_path] + argv)
+
+    def spawn_cleanup(self, host, cmd):
+        return self.spawn(host, cmd)
+
+    def spawn_copy(self, host, remote_path, local_dir):
+        argv = self.copy_command(host, remote_path, local_dir)
+        sys.stderr.write('+ %s\n' % ' '.join(argv))
+        return Job(host, ' '.join(argv), Popen(argv, env=self.environ(host)))
+
+    def environ(self, host):
+        return None
+
+    def wait_all(self, launchers, timeout=None):
+        # launchers are zero-argument callables returning a started Job
+        results = [None] * len(launchers)
+        pending = list(enumerate(launchers))
+        pending.reverse()
+        running = []
+
+        while pending or running:
+            while pending and len(running) < self.max_concurrency:
+                i, launch = pending.pop()
+                running.append((i, launch()))
+
+            still_running = []
+            for i, job in running:
+                if job.poll() is not None:
+                    results[i] = job.result()
+                elif timeout is not None and job.elapsed() > timeout:
+                    job.cancel()
+                    results[i] = job.result()
+                else:
+                    still_running.append((i, job))
+            running = still_running
+
+            if running:
+                time.sleep(self.poll_interval)
+
+        return results
+
+    def run_all(self, host_cmds, timeout=None):
+        launchers = [lambda h=host, c=cmd: self.spawn(h, c)
+                     for host, cmd in host_cmds]
+        return self.wait_all(launchers, timeout)
+
+    def copy_all(self, host_paths, local_dir, timeout=None):
+        launchers = [lambda h=host, p=remote_path:
+                     self.spawn_copy(h, p, local_dir)
+                     for host, remote_path in host_paths]
+        return self.wait_all(launchers, timeout)
+
+    def run(self, host, cmd, timeout=None):
+        return self.run_all([(host, cmd)], timeout)[0]
+
+
+class SshExecutor(Executor):
+    """Runs commands over ssh, sharing one master connection per host.
+
+    The master connections outlive this process (ControlPersist), so
+    consecutive Spearmint jobs reuse them instead of handshaking again.
+    """
+
+    def __init__(self, user='ubuntu', control_dir=None, persist='30m',
+                 **kwargs):
+        super(SshExecutor, self).__init__(**kwargs)
+        self.user = user
+        self.persist = persist
+
+        if control_dir is None:
+            control_dir = path.join(tempfile.gettempdir(), 'replication-ssh')
+        self.control_dir = control_dir
+
+        try:
+            os.makedirs(self.control_dir, 0700)
+        except OSError:
+            pass
+
+        self.hosts = set()
+
+    def ssh_opts(self):
+        return ['-o', 'ControlMaster=auto',
+                '-o', 'ControlPath=%s' % path.join(self.control_dir,
+                                                   '%r@%h:%p'),
+                '-o', 'ControlPersist=%s' % self.persist]
+
+    def target(self, host):
+        self.hosts.add(host)
+        return '%s@%s' % (self.user, host)
+
+    def command(self, host, cmd):
+        return ['ssh'] + self.ssh_opts() + [self.target(host), cmd]
+
+    def copy_command(self, host, remote_path, local_dir):
+        return (['scp', '-C'] + self.ssh_opts() +
+                ['%s:%s' % (self.target(host), remote_path), local_dir])
+
+    def start(self, hosts):
+        # open the master connections up front and in parallel
+        return self.run_all([(host, 'true') for host in hosts])
+
+    def close(self):
+        launchers = [lambda h=host: self.control(h, 'exit')
+                     for host in self.hosts]
+        self.wait_all(launchers)
+        self.hosts = set()
+
+    def control(self, host, ctl_cmd, ctl_args=()):
+        argv = (['ssh'] + self.ssh_opts() + ['-O', ctl_cmd] +
+                list(ctl_args) + ['%s@%s' % (self.user, host)])
+        return Job(host, ' '.join(argv), Popen(argv))
+
+
+class LocalExecutor(Executor):
+    """Runs commands on this machine, for tests and benchmarks.
+
+    If home_dir is given, every host gets its own HOME below it so that
+    remote paths such as ~/pantheon/test stay separate per host.
+    """
+
+    def __init__(self, home_dir=None, **kwargs):
+        super(LocalExecutor, self).__init__(**kwargs)
+        self.home_dir = home_dir
+
+    def environ(self, host):
+        if self.home_dir is None:
+            return None
+
+        home = path.join(self.home_dir, host)
+        try:
+            os.makedirs(home)
+        except OSError:
+            pass
+
+        env = dict(os.environ)
+        env['HOME'] = home
+        return env
+
+    def command(self, host, cmd):
+        return ['sh', '-c', cmd]
+
+    def copy_command(self, host, remote_path, local_dir):
+        return ['sh', '-c', 'cp %s %s' % (remote_path, local_dir)]
+
+
+class TimeoutTransport(xmlrpclib.Transport):
+    def __init__(self, timeout):
+        xmlrpclib.Transport.__init__(self)
+        self.timeout = timeout
+
+    def make_connection(self, host):
+        conn = xmlrpclib.Transport.make_connection(self, host)
+        conn.timeout = self.timeout
+        return conn
+
+
+class AgentJob(Job):
+    """A job of a proxy agent, whose status is asked for at most every
+    status_interval seconds. Its output so far is in output."""
+
+    def __init__(self, host, cmd, client, status_interval):
+        super(AgentJob, self).__init__(host, cmd, None)
+        self.client = client
+        self.status_interval = status_interval
+        self.job_id = None
+        self.last_status = 0
+        self.offset = 0
+        self.output = ''
+
+    def fail(self, error):
+        sys.stderr.write('Error: agent on %s: %s\n' % (self.host, error))
+        self.returncode = 255
+        self.end_ts = time.time()
+
+    def poll(self):
+        if self.returncode is not None:
+            return self.returncode
+
+        now = time.time()
+        if now - self.last_status < self.status_interval:
+            return None
+        self.last_status = now
+
+        try:
+            status = self.client.status(self.job_id, self.offset)
+        except (socket.error, xmlrpclib.Error) as e:
+            self.fail(e)
+            return self.returncode
+
+        self.output += status['output'].data
+        self.offset = status['offset']
+        if status['returncode'] is not None:
+            self.returncode = status['returncode']
+            self.end_ts = time.time()
+
+        return self.returncode
+
+    def cancel(self):
+        if self.returncode is not None:
+            return
+
+        try:
+            self.client.cancel(self.job_id)
+        except (socket.error, xmlrpclib.Error):
+            pass
+
+        self.returncode = -9
+        self.end_ts = time.time()
+        self.cancelled = True
+
+
+class AgentCopyJob(Job):
+    """Files fetched from a proxy agent by a background thread."""
+
+    def __init__(self, host, cmd, client, remote_path, local_dir):
+        super(AgentCopyJob, self).__init__(host, cmd, None)
+        self.fetched = None
+        self.thread = threading.Thread(
+            target=self.fetch, args=(client, remote_path, local_dir))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def fetch(self, client, remote_path, local_dir):
+        try:
+            files = client.fetch(remote_path)
+            for file_path, size in files:
+                local_path = path.join(local_dir, path.basename(file_path))
+                with open(local_path, 'wb') as f:
+                    # piece by piece, so that the agent serves status()
+                    # calls of running jobs in between
+                    offset = 0
+                    while offset < size:
+                        data = zlib.decompress(
+                            client.read(file_path, offset).data)
+                        if not data:
+                            break
+                        f.write(data)
+                        offset += len(data)
+        except (socket.error, xmlrpclib.Error, IOError, zlib.error) as e:
+            sys.stderr.write('Error: fetching %s from %s: %s\n' % (
+                remote_path, self.host, e))
+            self.fetched = 255
+            return
+
+        # like scp, fail if nothing matched
+        self.fetched = 0 if files else 1
+
+    def poll(self):
+        if self.returncode is None and not self.thread.is_alive():
+            self.returncode = self.fetched
+            self.end_ts = time.time()
+        return self.returncode
+
+    def cancel(self):
+        # the fetch cannot be interrupted; whatever it writes is ignored
+        if self.poll() is not None:
+            return
+        self.returncode = -9
+        self.end_ts = time.time()
+        self.cancelled = True
+
+
+class AgentExecutor(SshExecutor):
+    """Runs proxy commands through the proxy_agent.py daemon on every host.
+
+    run_proxy.py is run by a fork of the warm agent instead of a new ssh
+    session and interpreter, cleanups are done by the agent itself and
+    logs come back over the same XML-RPC connection instead of scp. Any
+    other command still goes over ssh.
+
+    The agents only listen on their loopback interface, so a local port
+    is forwarded to every agent through the host's ssh master connection
+    (ssh -O forward), without a handshake of its own. start() opens the
+    masters and forwardings of all hosts in parallel. A forwarding lives
+    as long as its master, and its port is kept next to the control
+    socket, so that later jobs of the search reuse it. addresses maps
+    hosts to an (address, port) to connect to directly instead, e.g.
+    several loopback agents on this machine.
+    """
+
+    def __init__(self, port=default_port, addresses=None, rpc_timeout=30,
+                 status_interval=0.5, **kwargs):
+        super(AgentExecutor, self).__init__(**kwargs)
+        self.port = port
+        self.addresses = addresses or {}
+        self.rpc_timeout = rpc_timeout
+        self.status_interval = status_interval
+        self.clients = {}
+        self.ports = {}
+
+    def port_path(self, host):
+        return path.join(self.control_dir, '%s@%s.agent' % (self.user, host))
+
+    def forwarded(self, host):
+        # the local port an earlier job forwarded to the agent, if the
+        # master connection still listens on it
+        try:
+            with open(self.port_path(host)) as port_file:
+                local_port = int(port_file.read())
+            socket.create_connection(('127.0.0.1', local_port), 1).close()
+        except (IOError, ValueError, socket.error):
+            return None
+        return local_port
+
+    def forward_all(self, hosts):
+        # the probes stay bound until every host has a port of its own
+        probes = []
+        for host in hosts:
+            probes.append(socket.socket())
+            probes[-1].bind(('127.0.0.1', 0))
+        local_ports = [probe.getsockname()[1] for probe in probes]
+        for probe in probes:
+            probe.close()
+
+        # -O forward needs a master, which running anything opens
+        SshExecutor.start(self, hosts)
+        launchers = [
+            lambda h=host, p=local_port: self.control(
+                h, 'forward', ['-L', '%d:127.0.0.1:%d' % (p, self.port)])
+            for host, local_port in zip(hosts, local_ports)]
+
+        results = self.wait_all(launchers)
+        for host, local_port, result in zip(hosts, local_ports, results):
+            if not result.ok:
+                sys.stderr.write('Error: forwarding to the agent on %s '
+                                 'exited with %s\n' % (host,
+                                                       result.returncode))
+                continue
+
+            self.ports[host] = local_port
+            with open(self.port_path(host), 'w') as port_file:
+                port_file.write('%d\n' % local_port)
+        return results
+
+    def address(self, host):
+        if host in self.addresses:
+            return self.addresses[host]
+
+        if host not in self.ports:
+            local_port = self.forwarded(host)
+            if local_port is not None:
+                self.ports[host] = local_port
+            else:
+                self.forward_all([host])
+
+        # without a forwarding, the calls fail to connect and are retried
+        # through a new one
+        return '127.0.0.1', self.ports.get(host, 0)
+
+    def connect(self, host, timeout):
+        return xmlrpclib.ServerProxy(
+            'http://%s:%d/RPC2' % self.address(host), allow_none=True,
+            transport=TimeoutTransport(timeout))
+
+    def client(self, host):
+        if host not in self.clients:
+            self.clients[host] = self.connect(host, self.rpc_timeout)
+        return self.clients[host]
+
+    def forget(self, host):
+        # the forwarding may have gone with its master; look it up again
+        self.clients.pop(host, None)
+        self.ports.pop(host, None)
+
+    def start_job(self, host, cmd, method, *params):
+        sys.stderr.write('+ %s: %s\n' % (host, cmd))
+        client = self.client(host)
+        job = AgentJob(host, cmd, client, self.status_interval)
+
+        try:
+            job.job_id = getattr(client, method)(*params)
+        except (socket.error, xmlrpclib.Error) as e:
+            self.forget(host)
+            job.fail(e)
+        return job
+
+    def spawn_proxy(self, host, argv):
+        return self.start_job(host, ' '.join(['run_proxy.py'] + argv),
+                              'run', argv)
+
+    def spawn_cleanup(self, host, cmd):
+        # the agent runs its own fixed cleanup command in place of cmd
+        return self.start_job(host, 'cleanup', 'cleanup')
+
+    def spawn_copy(self, host, remote_path, local_dir):
+        cmd = 'fetch %s:%s' % (host, remote_path)
+        sys.stderr.write('+ %s\n' % cmd)
+        # the thread gets a connection of its own; every call reads only
+        # one piece of a file, so the usual timeout holds
+        return AgentCopyJob(host, cmd, self.connect(host, self.rpc_timeout),
+                            remote_path, local_dir)
+
+    def start(self, hosts):
+        # forward every host that has no live forwarding yet at once, then
+        # ping all the agents at once
+        for host in hosts:
+            if host not in self.addresses and host not in self.ports:
+                local_port = self.forwarded(host)
+                if local_port is not None:
+                    self.ports[host] = local_port
+        missing = [host for host in hosts
+                   if host not in self.addresses and host not in self.ports]
+        if missing:
+            self.forward_all(missing)
+
+        results = [None] * len(hosts)
+
+        def ping(i, host):
+            start_ts = time.time()
+            try:
+                self.connect(host, self.rpc_timeout).ping()
+                returncode = 0
+            except (socket.error, xmlrpclib.Error) as e:
+                sys.stderr.write('Error: agent on %s: %s\n' % (host, e))
+                returncode = 255
+            results[i] = Result(host, 'ping', returncode, start_ts,
+                                time.time())
+
+        threads = [threading.Thread(target=ping, args=(i, host))
+                   for i, host in enumerate(hosts)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def close(self):
+        # the forwardings persist with the ssh master connections
+        self.clients = {}
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import stat
+import shutil
+import hashlib
+from os import path
+
+
+def file_digest(file_path):
+    digest = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        while True:
+            block = f.read(1 << 20)
+            if not block:
+                break
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        # e.g. the store is on another file system
+        shutil.copy2(src, dst)
+
+
+class ResultStore(object):
+    """Content-addressed store of candidate results.
+
+    store_dir/objects/<sha1>    every distinct file content, once
+    store_dir/candidates/<id>/  hard links into objects, one directory
+                                per candidate, id being the hash of its
+                                file names and contents
+    <pointer>                   symlink to a candidate directory, e.g.
+                                the best results so far
+
+    Moving a pointer is a single atomic rename. gc() keeps the keep most
+    recent candidates plus every pointed-to one, evicts older ones while
+    the objects exceed max_bytes, and drops objects no candidate links.
+    """
+
+    def __init__(self, store_dir, keep=50, max_bytes=None, pointers=()):
+        self.store_dir = store_dir
+        self.objects_dir = path.join(store_dir, 'objects')
+        self.candidates_dir = path.join(store_dir, 'candidates')
+        self.keep = keep
+        self.max_bytes = max_bytes
+        self.pointers = set(pointers)
+
+        for d in [self.objects_dir, self.candidates_dir]:
+            try:
+                os.makedirs(d)
+            except OSError:
+                pass
+
+    def add_object(self, src):
+        digest = file_digest(src)
+        obj_path = path.join(self.objects_dir, digest)
+
+        if not path.isfile(obj_path):
+            tmp_path = '%s.%d.tmp' % (obj_path, os.getpid())
+            link_or_copy(src, tmp_path)
+            # stored contents are immutable; make accidental writes fail
+            os.chmod(tmp_path, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+            os.rename(tmp_path, obj_path)
+
+        return digest
+
+    def add(self, src_dir):
+        manifest = []
+        for name in sorted(os.listdir(src_dir)):
+            src = path.join(src_dir, name)
+            if path.isfile(src):
+                manifest.append((name, self.add_object(src)))
+
+        candidate_id = hashlib.sha1(
+            ''.join('%s %s\n' % item for item in manifest)).hexdigest()
+        candidate_dir = path.join(self.candidates_dir, candidate_id)
+
+        if path.isdir(candidate_dir):
+            os.utime(candidate_dir, None)
+            return candidate_id
+
+        tmp_dir = '%s.%d.tmp' % (candidate_dir, os.getpid())
+        os.makedirs(tmp_dir)
+        for name, digest in manifest:
+            os.link(path.join(self.objects_dir, digest),
+                    path.join(tmp_dir, name))
+        os.rename(tmp_dir, candidate_dir)
+
+        return candidate_id
+
+    def point(self, pointer, candidate_id):
+        self.pointers.add(pointer)
+
+        if path.isdir(pointer) and not path.islink(pointer):
+            # a full copy left by an older version: keep it in the store
+            self.add(pointer)
+            shutil.rmtree(pointer)
+
+        target = path.relpath(path.join(self.candidates_dir, candidate_id),
+                              path.dirname(path.abspath(pointer)))
+        tmp_link = '%s.%d.tmp' % (pointer, os.getpid())
+        try:
+            os.remove(tmp_link)
+        except OSError:
+            pass
+        os.symlink(target, tmp_link)
+        os.rename(tmp_link, pointer)
+
+    def pinned(self):
+        pinned = set()
+        for pointer in self.pointers:
+            if path.islink(pointer):
+                pinned.add(path.basename(os.readlink(pointer)))
+        return pinned
+
+    def candidates_by_age(self):
+        candidates = [c for c in os.listdir(self.candidates_dir)
+                      if not c.endswith('.tmp')]
+        return sorted(candidates, key=lambda c: path.getmtime(
+            path.join(self.candidates_dir, c)))
+
+    def drop_unlinked_objects(self):
+        total_bytes = 0
+        for name in os.listdir(self.objects_dir):
+            obj_path = path.join(self.objects_dir, name)
+            st = os.stat(obj_path)
+            if st.st_nlink <= 1 and not name.endswith('.tmp'):
+                os.remove(obj_path)
+            else:
+                total_bytes += st.st_size
+        return total_bytes
+
+    def remove_candidate(self, candidate_id):
+        sys.stderr.write('result store: evicting %s\n' % candidate_id)
+        shutil.rmtree(path.join(self.candidates_dir, candidate_id))
+
+    def gc(self):
+        pinned = self.pinned()
+        unpinned = [c for c in self.candidates_by_age() if c not in pinned]
+
+        excess = len(unpinned) - self.keep
+        for candidate_id in unpinned[:max(0, excess)]:
+            self.remove_candidate(candidate_id)
+        unpinned = unpinned[max(0, excess):]
+
+        total_bytes = self.drop_unlinked_objects()
+        while (self.max_bytes is not None and total_bytes > self.max_bytes
+               and unpinned):
+            self.remove_candidate(unpinned.pop(0))
+            total_bytes = self.drop_unlinked_objects()
+
+        return total_bytes
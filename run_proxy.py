@@ -1,18 +1,24 @@
 #!/usr/bin/env python
 
-import os
 import sys
+import json
 import random
 import argparse
-from subprocess import check_call
+from subprocess import check_call, CalledProcessError
 from os import path
+import scoring
+import gen_const_bandwidth_trace
+from trace_cache import TraceCache
+from lanes import LaneRunner
+import sampling
 
 pantheon = path.expanduser('~/pantheon')
 test_dir = path.join(pantheon, 'test')
 replication_dir = path.abspath(path.dirname(__file__))
+trace_cache = TraceCache(path.join(replication_dir, 'traces'))
 
 
-def run_test(args):
+def test_cmd(args):
     test_src = path.join(test_dir, 'test.py')
 
     params = []
@@ -32,33 +38,82 @@ def run_test(args):
 
     params += ['--extra-mm-link-args', '--uplink-queue=droptail '
                '--uplink-queue-args=packets=%d' % args['uplink_queue']]
+    if args['runtime']:
+        params += ['-t', str(args['runtime'])]
+
     params += ['--run-id', str(args['run_id']), args['cc']]
 
-    cmd = ['python', test_src] + params
+    return ['python', test_src] + params
+
+
+def run_test(args):
+    cmd = test_cmd(args)
     sys.stderr.write('+ %s\n' % ' '.join(cmd))
 
     try:
         check_call(cmd)
-    except:
-        sys.stderr.write('Error: %s run %d\n' % (args['cc'], args['run_id']))
+    except CalledProcessError as e:
+        sys.stderr.write('Error: %s run %d exited with %d\n' % (
+            args['cc'], args['run_id'], e.returncode))
+        return False
+    return True
+
+
+def run_in_lanes(runs, prog_args):
+    runner = LaneRunner(prog_args.lanes, netns=not prog_args.no_netns)
+    names = {}
+    tasks = []
+    for args in runs:
+        name = '%s run%d' % (args['cc'], args['run_id'])
+        names[name] = args
+        tasks.append((name, test_cmd(args)))
+
+    failed = []
 
+    def on_done(record):
+        args = names[record['name']]
+        if record['returncode'] != 0:
+            sys.stderr.write('Error: %s run %d exited with %d\n' % (
+                args['cc'], args['run_id'], record['returncode']))
+            failed.append(record['name'])
+        if prog_args.summarize:
+            summarize_log(args['cc'], args['run_id'])
 
-def gen_trace(bw):
-    traces_dir = path.join(replication_dir, 'traces')
+    records = runner.run(tasks, on_done)
+
+    # per-lane CPU and host load of every run, for checking interference
+    with open(path.join(test_dir, 'lanes.log'), 'a') as lanes_log:
+        for record in records:
+            lanes_log.write(json.dumps(record) + '\n')
+
+    return len(failed)
+
+
+def summarize_log(cc, run_id):
+    log_path = path.join(test_dir, '%s_datalink_run%s.log' % (cc, run_id))
     try:
-        os.makedirs(traces_dir)
-    except:
-        pass
+        scoring.write_log_summary(log_path)
+    except IOError:
+        sys.stderr.write('Error: cannot summarize %s\n' % log_path)
 
-    gen_trace_path = path.join(replication_dir, 'gen_const_bandwidth_trace.py')
-    bw = '%.2f' % bw
-    cmd = ['python', gen_trace_path, bw]
-    sys.stderr.write('+ %s\n' % ' '.join(cmd))
-    check_call(cmd, cwd=traces_dir)
-    return path.join(traces_dir, bw + 'mbps.trace')
 
+def gen_trace(bw, seed=None):
+    schedule = [(0, float('%.2f' % bw))]
+
+    def write_trace(trace_path):
+        sys.stderr.write('+ gen_trace %s\n' % trace_path)
+        gen_const_bandwidth_trace.write_trace(
+            trace_path, gen_const_bandwidth_trace.gen_trace(schedule,
+                                                            seed=seed))
+
+    # without a seed every run draws its own trace, so none is reused
+    if seed is None:
+        return trace_cache.fresh(write_trace)
+    return trace_cache.get('const_bandwidth', {'schedule': schedule},
+                           seed, write_trace)
 
-def main():
+
+def main(argv=None):
     parser = argparse.ArgumentParser()
     parser.add_argument('--run-id',
                         metavar='min_id,max_id', required=True)
@@ -77,7 +132,34 @@ def main():
             '--append', action='store_true', default=False)
     parser.add_argument('--schemes',
                         metavar='scheme1,scheme2,...', required=True)
-    prog_args = parser.parse_args()
+    parser.add_argument(
+            '--runtime', type=int, metavar='SECONDS',
+            help='length of each run (default: pantheon\'s own default)')
+    parser.add_argument(
+            '--summarize', action='store_true', default=False,
+            help='also reduce every datalink log to a compact summary')
+    parser.add_argument(
+            '--lanes', type=int, default=1, metavar='N',
+            help='run up to N scheme runs at once, each in its own '
+            'network namespace (default: one after another)')
+    parser.add_argument(
+            '--seed', type=int,
+            help='draw the parameters and trace of every run from a stream '
+            'of this seed and its run id, the same for every candidate '
+            '(default: unseeded)')
+    parser.add_argument(
+            '--sampling', choices=['random', 'lhs', 'sobol'],
+            default='random',
+            help='with --seed, spread the parameter draws of runs 1 to '
+            '--total-runs with a Latin hypercube or a Sobol sequence')
+    parser.add_argument(
+            '--total-runs', type=int, metavar='N',
+            help='number of runs of the --sampling design (default: the '
+            'last run id)')
+    parser.add_argument(
+            '--no-netns', action='store_true', default=False,
+            help='run lanes without network namespaces')
+    prog_args = parser.parse_args(argv)
 
     min_run_id, max_run_id = map(int, prog_args.run_id.split(','))
     bw_mean, bw_stddev = map(float, prog_args.bandwidth.split(','))
@@ -91,27 +173,55 @@ def main():
     # default mahimahi parameters
     args = {}
     args['append'] = prog_args.append
+    args['runtime'] = prog_args.runtime
 
+    total_runs = prog_args.total_runs or max_run_id
+
+    runs = []
     for run_id in xrange(min_run_id, max_run_id + 1):
         args['run_id'] = run_id
 
-        bw = max(0, random.gauss(bw_mean, bw_stddev))
-        trace_path = gen_trace(bw)
+        if prog_args.seed is None:
+            z = [random.gauss(0, 1) for _ in xrange(5)]
+            seed = None
+        else:
+            z = sampling.normal_draws(prog_args.seed, run_id, 5,
+                                      prog_args.sampling, total_runs)
+            seed = sampling.trace_seed(prog_args.seed, run_id)
+
+        bw = max(0, bw_mean + bw_stddev * z[0])
+        trace_path = gen_trace(bw, seed)
         args['uplink_trace'] = trace_path
         args['downlink_trace'] = trace_path
 
         args['delay'] = max(
-                0, int(round(random.gauss(delay_mean, delay_stddev))))
+                0, int(round(delay_mean + delay_stddev * z[1])))
         args['uplink_queue'] = max(
-                0, int(round(random.gauss(queue_mean, queue_stddev))))
+                0, int(round(queue_mean + queue_stddev * z[2])))
         args['uplink_loss'] = min(1, max(
-                0, random.gauss(uploss_mean, uploss_stddev)))
+                0, uploss_mean + uploss_stddev * z[3]))
         args['downlink_loss'] = min(1, max(
-                0, random.gauss(downloss_mean, downloss_stddev)))
+                0, downloss_mean + downloss_stddev * z[4]))
+
+        sys.stderr.write('%s\n' % trace_cache.stats())
 
         for cc in cc_schemes:
-            args['cc'] = cc
-            run_test(args)
+            runs.append(dict(args, cc=cc))
+
+    if prog_args.lanes > 1:
+        failed = run_in_lanes(runs, prog_args)
+    else:
+        failed = 0
+        for args in runs:
+            if not run_test(args):
+                failed += 1
+
+            if prog_args.summarize:
+                summarize_log(args['cc'], args['run_id'])
+
+    # the master retries a cell whose command exits non-zero
+    if failed:
+        sys.exit('Error: %d of %d runs failed' % (failed, len(runs)))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+
+import math
+import numpy as np
+
+# (s, a, m) of dimensions 2 to 5 of Joe and Kuo's new-joe-kuo-6.21201;
+# dimension 1 is the van der Corput sequence
+joe_kuo = [
+    (1, 0, [1]),
+    (2, 1, [1, 3]),
+    (3, 1, [1, 3, 1]),
+    (3, 2, [1, 1, 1]),
+]
+
+sobol_bits = 32
+max_dims = len(joe_kuo) + 1
+
+
+def sobol_direction_numbers():
+    directions = [[1 << (sobol_bits - 1 - i) for i in xrange(sobol_bits)]]
+
+    for s, a, m in joe_kuo:
+        v = [0] * sobol_bits
+        for i in xrange(s):
+            v[i] = m[i] << (sobol_bits - 1 - i)
+        for i in xrange(s, sobol_bits):
+            v[i] = v[i - s] ^ (v[i - s] >> s)
+            for k in xrange(1, s):
+                v[i] ^= ((a >> (s - 1 - k)) & 1) * v[i - k]
+        directions.append(v)
+
+    return directions
+
+
+def sobol_points(n, dims, seed):
+    """First n points of a digitally shifted Sobol sequence in [0, 1)^dims,
+    in Gray code order."""
+    if dims > max_dims:
+        raise ValueError('Sobol points have at most %d dimensions' %
+                         max_dims)
+
+    directions = sobol_direction_numbers()[:dims]
+    shift = np.random.RandomState(seed).randint(
+        0, 1 << 16, size=(dims, 2))
+
+    points = np.empty((n, dims))
+    for d in xrange(dims):
+        x = (int(shift[d][0]) << 16) | int(shift[d][1])
+        for index in xrange(n):
+            gray = index ^ (index >> 1)
+            code = 0
+            bit = 0
+            while gray:
+                if gray & 1:
+                    code ^= directions[d][bit]
+                gray >>= 1
+                bit += 1
+            points[index][d] = ((code ^ x) + 0.5) / float(1 << sobol_bits)
+
+    return points
+
+
+def lhs_points(n, dims, seed):
+    """Latin hypercube of n points in (0, 1)^dims: every dimension has
+    exactly one point in each of its n strata."""
+    rng = np.random.RandomState(seed)
+    points = np.empty((n, dims))
+    for d in xrange(dims):
+        points[:, d] = (rng.permutation(n) + rng.uniform(size=n)) / n
+    return points
+
+
+# Acklam's rational approximation of the inverse normal CDF, accurate to
+# about 1e-9 relative error
+acklam_a = [-3.969683028665376e+01, 2.209460984245205e+02,
+            -2.759285104469687e+02, 1.383577518672690e+02,
+            -3.066479806614716e+01, 2.506628277459239e+00]
+acklam_b = [-5.447609879822406e+01, 1.615858368580409e+02,
+            -1.556989798598866e+02, 6.680131188771972e+01,
+            -1.328068155288572e+01]
+acklam_c = [-7.784894002430293e-03, -3.223964580411365e-01,
+            -2.400758277161838e+00, -2.549732539343734e+00,
+            4.374664141464968e+00, 2.938163982698783e+00]
+acklam_d = [7.784695709041462e-03, 3.224671290700398e-01,
+            2.445134137142996e+00, 3.754408661907416e+00]
+acklam_low = 0.02425
+
+
+def polyval(coeffs, x):
+    result = 0.0
+    for c in coeffs:
+        result = result * x + c
+    return result
+
+
+def inverse_normal(p):
+    if p <= 0 or p >= 1:
+        raise ValueError('p must be in (0, 1)')
+
+    if p < acklam_low:
+        q = math.sqrt(-2 * math.log(p))
+        return polyval(acklam_c, q) / (polyval(acklam_d, q) * q + 1)
+
+    if p > 1 - acklam_low:
+        q = math.sqrt(-2 * math.log(1 - p))
+        return -polyval(acklam_c, q) / (polyval(acklam_d, q) * q + 1)
+
+    q = p - 0.5
+    r = q * q
+    return polyval(acklam_a, r) * q / (polyval(acklam_b, r) * r + 1)
+
+
+def run_stream(seed, run_id):
+    # every run_id has its own stream, the same for every candidate
+    return np.random.RandomState([seed, run_id])
+
+
+def normal_draws(seed, run_id, dims, sampling='random', total_runs=None):
+    """Standard normal draws of one run, shared by every candidate that
+    uses the same seed (common random numbers).
+
+    With 'lhs' or 'sobol' sampling, the draws of runs 1 to total_runs
+    come from one stratified design, so that even a few runs cover the
+    spread of every parameter evenly. Every run derives the whole design
+    from the seed, which lets runs of one design go to different hosts.
+    """
+    if sampling == 'random':
+        return list(run_stream(seed, run_id).standard_normal(dims))
+
+    if total_runs is None or not 1 <= run_id <= total_runs:
+        raise ValueError('run %d is outside of the %s design of %s runs' % (
+            run_id, sampling, total_runs))
+
+    if sampling == 'lhs':
+        points = lhs_points(total_runs, dims, seed)
+    elif sampling == 'sobol':
+        points = sobol_points(total_runs, dims, seed)
+    else:
+        raise ValueError('unknown sampling %s' % sampling)
+
+    return [inverse_normal(u) for u in points[run_id - 1]]
+
+
+def trace_seed(seed, run_id):
+    # kept apart from the parameter draws so that the traces of a run_id
+    # do not depend on the sampling
+    return int(np.random.RandomState([seed, run_id, 1]).randint(1 << 30))
@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+
+import sys
+import time
+from collections import deque
+
+
+class Attempt(object):
+    def __init__(self, cell, host, job, speculative=False):
+        self.cell = cell
+        self.host = host
+        self.job = job
+        self.speculative = speculative
+        self.status = 'running'
+
+    @property
+    def start_ts(self):
+        return self.job.start_ts
+
+    @property
+    def end_ts(self):
+        return self.job.end_ts
+
+    def elapsed(self):
+        return self.job.elapsed()
+
+    def __repr__(self):
+        return 'Attempt(cell=%s, host=%s, status=%s, elapsed=%.2fs%s)' % (
+            self.cell, self.host, self.status, self.elapsed(),
+            ', speculative' if self.speculative else '')
+
+
+def median(values):
+    values = sorted(values)
+    n = len(values)
+    if n % 2:
+        return values[n / 2]
+    return (values[n / 2 - 1] + values[n / 2]) / 2.0
+
+
+class Scheduler(object):
+    """Work queue of cells pulled by whichever host is idle.
+
+    launch(host, cell) starts a cell and returns a Job. A cell that
+    fails or runs longer than timeout goes back on the queue until it
+    has been tried max_attempts times. If cleanup(host) is given, it is
+    started after a failed or cancelled attempt and must return a Job;
+    the host only takes new cells once that job is done.
+
+    on_success(attempt) is called as soon as a cell succeeds and on_poll()
+    once per round of polling, so callers can overlap their own work with
+    the cells still running.
+
+    If affinity(host, cell) is given, a host only takes cells for which
+    it returns True.
+
+    With speculate set, a host that finds no cell to take duplicates the
+    oldest running cell whose elapsed time exceeds straggler_factor times
+    the median duration of the cells completed so far. Whichever copy
+    succeeds first wins and the other one is cancelled.
+    """
+
+    def __init__(self, hosts, launch, cleanup=None, timeout=None,
+                 max_attempts=3, poll_interval=0.1, affinity=None,
+                 speculate=False, straggler_factor=1.5, min_samples=5):
+        self.hosts = list(hosts)
+        self.launch = launch
+        self.affinity = affinity
+        self.cleanup = cleanup
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.speculate = speculate
+        self.straggler_factor = straggler_factor
+        self.min_samples = min_samples
+
+    def straggler_threshold(self):
+        if len(self.durations) < max(1, self.min_samples):
+            return None
+        return self.straggler_factor * median(self.durations)
+
+    def allowed(self, host, cell):
+        return self.affinity is None or self.affinity(host, cell)
+
+    def assign(self, idle, queue):
+        assigned = []
+        for host in list(idle):
+            for cell in queue:
+                if self.allowed(host, cell):
+                    idle.remove(host)
+                    queue.remove(cell)
+                    assigned.append((host, cell))
+                    break
+
+        return assigned
+
+    def find_straggler(self, running, host):
+        threshold = self.straggler_threshold()
+        if threshold is None:
+            return None
+
+        copies = {}
+        for attempt in running:
+            copies[attempt.cell] = copies.get(attempt.cell, 0) + 1
+
+        stragglers = [a for a in running
+                      if copies[a.cell] == 1 and a.elapsed() > threshold and
+                      self.allowed(host, a.cell)]
+        if not stragglers:
+            return None
+
+        return max(stragglers, key=lambda a: a.elapsed())
+
+    def run(self, cells, on_success=None, on_poll=None):
+        queue = deque(cells)
+        idle = deque(self.hosts)
+        cooling = []
+        running = []
+        tries = dict((cell, 0) for cell in queue)
+
+        self.attempts = []
+        self.durations = []
+        self.done = {}
+        self.failed = []
+
+        def release(host):
+            if self.cleanup is not None:
+                cooling.append((host, self.cleanup(host)))
+            else:
+                idle.append(host)
+
+        while queue or running:
+            for host, cell in self.assign(idle, queue):
+                tries[cell] += 1
+
+                attempt = Attempt(cell, host, self.launch(host, cell))
+                self.attempts.append(attempt)
+                running.append(attempt)
+
+            for host in list(idle) if self.speculate else []:
+                straggler = self.find_straggler(running, host)
+                if straggler is None:
+                    continue
+
+                idle.remove(host)
+                sys.stderr.write('Straggler: %s on %s after %.2fs, '
+                                 'duplicating on %s\n' % (
+                                     straggler.cell, straggler.host,
+                                     straggler.elapsed(), host))
+                attempt = Attempt(straggler.cell, host,
+                                  self.launch(host, straggler.cell),
+                                  speculative=True)
+                self.attempts.append(attempt)
+                running.append(attempt)
+
+            if not running and not cooling:
+                sys.stderr.write('Error: no hosts left to run %d cells\n' %
+                                 len(queue))
+                self.failed.extend(queue)
+                break
+
+            finished = []
+            for attempt in running:
+                returncode = attempt.job.poll()
+
+                if returncode is None:
+                    if (self.timeout is not None and
+                            attempt.elapsed() > self.timeout):
+                        attempt.job.cancel()
+                        attempt.status = 'timeout'
+                        finished.append(attempt)
+                    continue
+
+                attempt.status = 'ok' if returncode == 0 else 'failed'
+                finished.append(attempt)
+
+            for attempt in finished:
+                if attempt not in running:
+                    # already cancelled as the loser of a duplicated cell
+                    continue
+                running.remove(attempt)
+
+                if attempt.status == 'ok':
+                    self.done[attempt.cell] = attempt
+                    self.durations.append(attempt.elapsed())
+                    idle.append(attempt.host)
+
+                    for loser in [a for a in running
+                                  if a.cell == attempt.cell]:
+                        loser.job.cancel()
+                        loser.status = 'cancelled'
+                        running.remove(loser)
+                        release(loser.host)
+
+                    if on_success is not None:
+                        on_success(attempt)
+                    continue
+
+                sys.stderr.write('Error: %s %s on %s after %.2fs\n' % (
+                    attempt.cell, attempt.status, attempt.host,
+                    attempt.elapsed()))
+
+                if [a for a in running if a.cell == attempt.cell]:
+                    # another copy of this cell is still running
+                    pass
+                elif tries[attempt.cell] < self.max_attempts:
+                    queue.append(attempt.cell)
+                else:
+                    self.failed.append(attempt.cell)
+
+                release(attempt.host)
+
+            still_cooling = []
+            for host, job in cooling:
+                if job.poll() is None:
+                    still_cooling.append((host, job))
+                else:
+                    idle.append(host)
+            cooling = still_cooling
+
+            if on_poll is not None:
+                on_poll()
+
+            if running or cooling:
+                time.sleep(self.poll_interval)
+
+        for host, job in cooling:
+            job.wait()
+
+        return self.done
+
+    def speculation_report(self):
+        """Pair every duplicate with the attempt it was copied from.
+
+        A cancelled original never finished, so its elapsed time is only
+        a lower bound on how long the cell would have held the candidate.
+        """
+        report = []
+        for spec in [a for a in self.attempts if a.speculative]:
+            original = [a for a in self.attempts
+                        if a.cell == spec.cell and not a.speculative and
+                        a.start_ts <= spec.start_ts]
+            if not original:
+                continue
+            original = original[-1]
+
+            report.append({
+                'cell': spec.cell,
+                'original_host': original.host,
+                'original_status': original.status,
+                'original_elapsed': original.elapsed(),
+                'duplicate_host': spec.host,
+                'duplicate_status': spec.status,
+                'duplicate_elapsed': spec.elapsed()})
+
+        return report
@@ -0,0 +1,295 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import json
+import hashlib
+import warnings
+import argparse
+from os import path
+import numpy as np
+
+import datalink_log
+from datalink_log import DEPARTURE
+
+
+def run_stats(columns):
+    """Average throughput (Mbit/s) and 95th percentile per-packet delay
+    (ms) of one datalink log, computed like pantheon's tunnel graph:
+    departed bits over the time from the first departure to the last,
+    and the delay numpy's nearest-rank percentile picks."""
+    departures = columns.event == DEPARTURE
+    if not departures.any():
+        return np.nan, np.nan
+
+    departure_ts = columns.ts[departures]
+    duration = departure_ts[-1] - departure_ts[0]
+    if duration <= 0:
+        return np.nan, np.nan
+
+    tput = columns.size[departures].sum() * 8.0 / (1000.0 * duration)
+    delay = np.percentile(columns.delay[departures], 95,
+                          interpolation='nearest')
+    return tput, delay
+
+
+# delay percentiles kept in the compact summary of a run
+summary_percentiles = [5, 25, 50, 75, 90, 95, 99]
+
+
+def log_summary(columns):
+    """Reduce one datalink log to what scoring needs plus per-second
+    throughput (Mbit/s) and mean delay (ms) series."""
+    departures = columns.event == DEPARTURE
+    summary = {'stats': np.array(run_stats(columns)),
+               'percentiles': np.array(summary_percentiles)}
+
+    if not departures.any():
+        summary['delay_percentiles'] = np.zeros(0)
+        summary['tput_series'] = np.zeros(0)
+        summary['delay_series'] = np.zeros(0)
+        return summary
+
+    delay = columns.delay[departures]
+    sec = ((columns.ts[departures] - columns.ts[0]) // 1000).astype(np.int64)
+    bits = columns.size[departures] * 8.0
+    pkts = np.bincount(sec)
+
+    summary['delay_percentiles'] = np.percentile(delay, summary_percentiles)
+    summary['tput_series'] = np.bincount(sec, weights=bits) / 1e6
+    with np.errstate(all='ignore'):
+        summary['delay_series'] = np.bincount(sec, weights=delay) / pkts
+    return summary
+
+
+def summary_path(log_path):
+    return log_path[:-len('.log')] + '.summary.npz'
+
+
+def write_log_summary(log_path):
+    dst_path = summary_path(log_path)
+    tmp_path = '%s.%d.tmp' % (dst_path, os.getpid())
+    with open(tmp_path, 'wb') as summary_file:
+        np.savez_compressed(summary_file,
+                            **log_summary(datalink_log.load(log_path)))
+    os.rename(tmp_path, dst_path)
+    return dst_path
+
+
+def read_log_summary(summary_path):
+    with np.load(summary_path) as summary:
+        return tuple(summary['stats'])
+
+
+def read_run_times(logs_dir):
+    metadata_path = path.join(logs_dir, 'pantheon_metadata.json')
+    with open(metadata_path) as metadata_file:
+        return json.load(metadata_file)['run_times']
+
+
+def log_path(logs_dir, cc, run_id):
+    return path.join(logs_dir, '%s_datalink_run%s.log' % (cc, run_id))
+
+
+def summarize_experiment(logs_dir, schemes, run_times=None):
+    """Return {scheme: array of (throughput, delay) rows, one per run}.
+
+    Runs whose log is missing or empty are NaN rows.
+    """
+    if run_times is None:
+        run_times = read_run_times(logs_dir)
+
+    summary = {}
+    for cc in schemes:
+        stats = np.empty((run_times, 2))
+        stats.fill(np.nan)
+
+        for run_id in xrange(1, run_times + 1):
+            try:
+                columns = datalink_log.load(log_path(logs_dir, cc, run_id))
+            except IOError:
+                continue
+            stats[run_id - 1] = run_stats(columns)
+
+        summary[cc] = stats
+
+    return summary
+
+
+summary_sidecar = '.replication_summary.npz'
+
+# bumped whenever run_stats() changes what it computes from a log
+summary_version = 2
+
+
+def content_digest(logs_dir, schemes, run_times):
+    digest = hashlib.sha1()
+    digest.update('version %d\0' % summary_version)
+    digest.update(' '.join(schemes))
+
+    for cc in schemes:
+        for run_id in xrange(1, run_times + 1):
+            digest.update('\0%s %s\0' % (cc, run_id))
+            try:
+                with open(log_path(logs_dir, cc, run_id), 'rb') as log:
+                    while True:
+                        block = log.read(1 << 20)
+                        if not block:
+                            break
+                        digest.update(block)
+            except IOError:
+                digest.update('missing')
+
+    return digest.hexdigest()
+
+
+def cached_summary(logs_dir, schemes):
+    """summarize_experiment for logs that never change, such as the real
+    experiment being replicated.
+
+    The summary is kept in a sidecar file inside logs_dir and reused as
+    long as the content hash of the logs and summary_version still match.
+    """
+    run_times = read_run_times(logs_dir)
+    digest = content_digest(logs_dir, schemes, run_times)
+    sidecar_path = path.join(logs_dir, summary_sidecar)
+
+    try:
+        with np.load(sidecar_path) as sidecar:
+            if str(sidecar['digest']) == digest:
+                return dict(zip(schemes, sidecar['stats']))
+    except (IOError, KeyError, ValueError):
+        pass
+
+    summary = summarize_experiment(logs_dir, schemes, run_times)
+
+    tmp_path = '%s.%d.tmp' % (sidecar_path, os.getpid())
+    try:
+        with open(tmp_path, 'wb') as sidecar_file:
+            np.savez(sidecar_file, digest=digest,
+                     stats=np.array([summary[cc] for cc in schemes]))
+        os.rename(tmp_path, sidecar_path)
+    except (IOError, OSError):
+        sys.stderr.write('Warning: cannot write %s\n' % sidecar_path)
+
+    return summary
+
+
+def relative_difference(real, emulated):
+    return abs(emulated - real) / real * 100.0
+
+
+def compare(real_summary, emu_summary, schemes):
+    """Median throughput and delay differences (%) of every scheme and
+    their averages over all schemes."""
+    result = {'schemes': {}}
+    tput_diffs = []
+    delay_diffs = []
+
+    for cc in schemes:
+        # schemes without a single valid run end up NaN
+        with warnings.catch_warnings(), np.errstate(all='ignore'):
+            warnings.simplefilter('ignore', RuntimeWarning)
+            real = np.nanmedian(real_summary[cc], axis=0)
+            emulated = np.nanmedian(emu_summary[cc], axis=0)
+            tput_diff = relative_difference(real[0], emulated[0])
+            delay_diff = relative_difference(real[1], emulated[1])
+
+        result['schemes'][cc] = {
+            'real_tput': real[0], 'emulated_tput': emulated[0],
+            'real_delay': real[1], 'emulated_delay': emulated[1],
+            'tput_diff': tput_diff, 'delay_diff': delay_diff}
+        tput_diffs.append(tput_diff)
+        delay_diffs.append(delay_diff)
+
+    result['tput_median_score'] = float(np.mean(tput_diffs))
+    result['delay_median_score'] = float(np.mean(delay_diffs))
+    result['overall_median_score'] = (result['tput_median_score'] +
+                                      result['delay_median_score']) / 2.0
+    return result
+
+
+def bootstrap_scores(real_summary, emu_summary, schemes, bootstraps=1000,
+                     seed=0):
+    """(tput, delay, overall) scores of bootstraps resamples of the
+    emulated runs of every scheme, as rows; the real runs stay fixed."""
+    rng = np.random.RandomState(seed)
+    tput_diffs = np.empty((bootstraps, len(schemes)))
+    delay_diffs = np.empty((bootstraps, len(schemes)))
+
+    for i, cc in enumerate(schemes):
+        runs = emu_summary[cc][~np.isnan(emu_summary[cc]).any(axis=1)]
+        with warnings.catch_warnings(), np.errstate(all='ignore'):
+            warnings.simplefilter('ignore', RuntimeWarning)
+            real = np.nanmedian(real_summary[cc], axis=0)
+            if len(runs) == 0:
+                tput_diffs[:, i] = np.nan
+                delay_diffs[:, i] = np.nan
+                continue
+
+            resamples = runs[rng.randint(0, len(runs),
+                                         (bootstraps, len(runs)))]
+            emulated = np.median(resamples, axis=1)
+            tput_diffs[:, i] = relative_difference(real[0], emulated[:, 0])
+            delay_diffs[:, i] = relative_difference(real[1], emulated[:, 1])
+
+    tput = tput_diffs.mean(axis=1)
+    delay = delay_diffs.mean(axis=1)
+    return np.column_stack([tput, delay, (tput + delay) / 2.0])
+
+
+def confidence_interval(samples, confidence=0.9):
+    tail = (1.0 - confidence) / 2 * 100
+    return tuple(np.percentile(samples, [tail, 100 - tail]))
+
+
+def score_summary(real_dir, emu_summary, schemes):
+    return compare(cached_summary(real_dir, schemes), emu_summary, schemes)
+
+
+def score_experiments(real_dir, emu_dir, schemes):
+    emu_summary = summarize_experiment(emu_dir, schemes)
+    return score_summary(real_dir, emu_summary, schemes)
+
+
+def scores_tuple(result):
+    return (result['tput_median_score'], result['delay_median_score'],
+            result['overall_median_score'])
+
+
+def format_result(result, schemes):
+    # same trailing lines as pantheon's compare_two_experiments.py, which
+    # get_best_score in proxy_master.py relies on
+    lines = []
+    for cc in schemes:
+        r = result['schemes'][cc]
+        lines.append('%s: median throughput %.2f vs %.2f Mbit/s (%.2f%%), '
+                     'median delay %.2f vs %.2f ms (%.2f%%)' % (
+                         cc, r['real_tput'], r['emulated_tput'],
+                         r['tput_diff'], r['real_delay'],
+                         r['emulated_delay'], r['delay_diff']))
+
+    lines.append('Average median throughput difference')
+    lines.append('%.2f%%' % result['tput_median_score'])
+    lines.append('Average median delay difference')
+    lines.append('%.2f%%' % result['delay_median_score'])
+    lines.append('Average median difference for throughput and delay')
+    lines.append('%.2f%%' % result['overall_median_score'])
+    return '\n'.join(lines) + '\n'
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('real_dir', metavar='REAL-LOGS-DIR')
+    parser.add_argument('emu_dir', metavar='EMULATED-LOGS-DIR')
+    parser.add_argument('--analyze-schemes', metavar='"SCHEME1 SCHEME2..."',
+                        required=True)
+    args = parser.parse_args()
+
+    schemes = args.analyze_schemes.split()
+    result = score_experiments(args.real_dir, args.emu_dir, schemes)
+    sys.stdout.write(format_result(result, schemes))
+
+
+if __name__ == '__main__':
+    main()
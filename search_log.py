@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import json
+import time
+from os import path
+
+from eval_cache import emulation_params, evaluation_settings
+
+score_names = ['tput_median_score', 'delay_median_score',
+               'overall_median_score']
+
+
+def evaluation_key(args):
+    # exact parameters, so that only a re-proposed candidate matches
+    items = ['%s=%r,%r' % (name, float(args[name][0]), float(args[name][1]))
+             for name in emulation_params]
+    items += evaluation_settings(args)
+    return ';'.join(items)
+
+
+def parse_value(value):
+    for convert in [int, float]:
+        try:
+            return convert(value)
+        except ValueError:
+            pass
+    return value
+
+
+def legacy_record(line):
+    # "key=value,key=value,..." lines written before the log was JSON
+    record = {}
+    for item in line.strip().split(','):
+        if '=' in item:
+            key, value = item.split('=', 1)
+            record[key] = parse_value(value)
+
+    for name in emulation_params:
+        if name in record:
+            record[name] = [record[name], 0]
+    if 'rung_scores' in record:
+        record['rung_scores'] = [
+            float(s) for s in str(record['rung_scores']).split('/')]
+    if 'time' in record:
+        record['time'] = float(str(record['time'])[:-len('min')])
+    return record
+
+
+def read_records(log_path):
+    records = []
+    if not path.isfile(log_path):
+        return records
+
+    with open(log_path) as log:
+        for line in log:
+            if line.endswith('\n'):
+                records.append(json.loads(line))
+    return records
+
+
+class SearchLog(object):
+    """Append-only JSONL log of every evaluated candidate.
+
+    Each record is flushed and fsynced before append() returns. A sidecar
+    index holds the byte size it covers, the best record for every score
+    and the offset of every evaluation key, so that opening the log only
+    reads the records appended since the index was last written. A
+    truncated last line, left by a crash mid-write, is cut off.
+    """
+
+    def __init__(self, log_path, legacy_path=None):
+        self.log_path = log_path
+        self.index_path = log_path + '.index'
+
+        if not path.isfile(log_path) and legacy_path is not None and \
+                path.isfile(legacy_path):
+            self.import_legacy(legacy_path)
+
+        self.index = {'size': 0, 'count': 0, 'best': {}, 'offsets': {}}
+        if path.isfile(self.index_path):
+            with open(self.index_path) as index_file:
+                try:
+                    self.index = json.load(index_file)
+                except ValueError:
+                    pass
+
+        self.repair()
+        self.log = open(log_path, 'a')
+
+    def import_legacy(self, legacy_path):
+        sys.stderr.write('search log: importing %s\n' % legacy_path)
+        tmp_path = '%s.%d.tmp' % (self.log_path, os.getpid())
+        with open(legacy_path) as legacy, open(tmp_path, 'w') as log:
+            for line in legacy:
+                if line.strip():
+                    log.write(json.dumps(legacy_record(line)) + '\n')
+        os.rename(tmp_path, self.log_path)
+
+    def repair(self):
+        if not path.isfile(self.log_path):
+            self.index = {'size': 0, 'count': 0, 'best': {}, 'offsets': {}}
+            return
+
+        size = path.getsize(self.log_path)
+        if self.index['size'] > size:
+            # the index is newer than the log it describes; start over
+            self.index = {'size': 0, 'count': 0, 'best': {}, 'offsets': {}}
+
+        with open(self.log_path, 'rb+') as log:
+            log.seek(self.index['size'])
+            offset = self.index['size']
+            for line in log:
+                if not line.endswith('\n'):
+                    sys.stderr.write('search log: dropping truncated record '
+                                     'at byte %d\n' % offset)
+                    log.truncate(offset)
+                    break
+                self.add_to_index(json.loads(line), offset)
+                offset += len(line)
+
+        self.index['size'] = offset
+        self.save_index()
+
+    def add_to_index(self, record, offset):
+        self.index['count'] += 1
+        if 'key' in record:
+            self.index['offsets'][record['key']] = offset
+
+        # scores measured at a lower fidelity than the full one are not
+        # comparable with the best
+        if not record.get('full_fidelity', True):
+            return
+
+        for name in score_names:
+            if name not in record:
+                continue
+            best = self.index['best'].get(name)
+            if best is None or record[name] < best[name]:
+                self.index['best'][name] = record
+
+    def save_index(self):
+        tmp_path = '%s.%d.tmp' % (self.index_path, os.getpid())
+        with open(tmp_path, 'w') as index_file:
+            json.dump(self.index, index_file)
+            index_file.flush()
+            os.fsync(index_file.fileno())
+        os.rename(tmp_path, self.index_path)
+
+    def append(self, record):
+        line = json.dumps(record) + '\n'
+        self.log.write(line)
+        self.log.flush()
+        os.fsync(self.log.fileno())
+
+        self.add_to_index(record, self.index['size'])
+        self.index['size'] += len(line)
+        self.save_index()
+
+    def best(self, score_name='overall_median_score'):
+        return self.index['best'].get(score_name)
+
+    def best_score(self, score_name='overall_median_score'):
+        best = self.best(score_name)
+        if best is None:
+            return sys.maxint
+        return best[score_name]
+
+    def completed(self, args, ttl=None):
+        # the last record of the same evaluation, unless it is older than
+        # ttl seconds
+        offset = self.index['offsets'].get(evaluation_key(args))
+        if offset is None:
+            return None
+
+        with open(self.log_path) as log:
+            log.seek(offset)
+            record = json.loads(log.readline())
+
+        if ttl is not None and time.time() - record.get('created', 0) > ttl:
+            return None
+        return record
+
+    def records(self):
+        return read_records(self.log_path)
+
+    def __len__(self):
+        return self.index['count']
+
+    def close(self):
+        self.log.close()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+
+import os
+import json
+import fcntl
+import random
+import hashlib
+from os import path
+
+
+class TraceCache(object):
+    """Traces of one proxy, keyed by (generator, params, seed).
+
+    A trace is written to a temporary file and renamed into place, so
+    concurrent runs never see a partial trace and never race on a shared
+    file name. Reading a trace refreshes its mtime; once the traces take
+    more than max_bytes, the least recently used ones are removed. Hit
+    and miss counts are kept in stats.json, shared by every process on
+    the host.
+    """
+
+    def __init__(self, cache_dir, max_bytes=512 * 1024 ** 2):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.stats_path = path.join(cache_dir, 'stats.json')
+
+        try:
+            os.makedirs(cache_dir)
+        except OSError:
+            pass
+
+    def key(self, generator, params, seed):
+        return hashlib.sha1(json.dumps([generator, params, seed],
+                                       sort_keys=True)).hexdigest()
+
+    def trace_path(self, key):
+        return path.join(self.cache_dir, key + '.trace')
+
+    def get(self, generator, params, seed, write_trace):
+        """Path of the cached trace, calling write_trace(tmp_path) to
+        create it first if it is not cached yet."""
+        trace_path = self.trace_path(self.key(generator, params, seed))
+
+        try:
+            os.utime(trace_path, None)
+            self.count('hits')
+            return trace_path
+        except OSError:
+            pass
+
+        self.write(trace_path, write_trace)
+        self.count('misses')
+        self.evict(keep=trace_path)
+        return trace_path
+
+    def fresh(self, write_trace):
+        """Path of a new trace written by write_trace(tmp_path) that no
+        later call returns, for traces that must be drawn anew every time.
+        It is evicted like the cached ones and not counted in stats."""
+        trace_path = path.join(self.cache_dir, 'fresh.%d.%d.trace' % (
+            os.getpid(), random.randint(0, 1 << 30)))
+        self.write(trace_path, write_trace)
+        self.evict(keep=trace_path)
+        return trace_path
+
+    def write(self, trace_path, write_trace):
+        tmp_path = '%s.%d.%d.tmp' % (trace_path, os.getpid(),
+                                     random.randint(0, 1 << 30))
+        try:
+            write_trace(tmp_path)
+            os.rename(tmp_path, trace_path)
+        except:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def evict(self, keep=None):
+        traces = []
+        total_bytes = 0
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.trace'):
+                continue
+            trace_path = path.join(self.cache_dir, name)
+            try:
+                st = os.stat(trace_path)
+            except OSError:
+                continue
+            traces.append((st.st_mtime, trace_path, st.st_size))
+            total_bytes += st.st_size
+
+        for _, trace_path, size in sorted(traces):
+            if total_bytes <= self.max_bytes:
+                break
+            if trace_path == keep:
+                continue
+            try:
+                os.remove(trace_path)
+            except OSError:
+                pass
+            total_bytes -= size
+
+    def read_stats(self):
+        stats = {'hits': 0, 'misses': 0}
+        try:
+            with open(self.stats_path) as stats_file:
+                stats.update(json.load(stats_file))
+        except (IOError, ValueError):
+            pass
+        return stats
+
+    def update_stats(self, update):
+        with open(self.stats_path + '.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+
+            stats = self.read_stats()
+            update(stats)
+            tmp_path = '%s.%d.tmp' % (self.stats_path, os.getpid())
+            with open(tmp_path, 'w') as stats_file:
+                json.dump(stats, stats_file)
+            os.rename(tmp_path, self.stats_path)
+            return stats
+
+    def count(self, name):
+        def increment(stats):
+            stats[name] += 1
+        self.update_stats(increment)
+
+    def stats(self):
+        stats = self.read_stats()
+        lookups = stats['hits'] + stats['misses']
+        hit_rate = float(stats['hits']) / lookups if lookups else 0.0
+        return 'trace cache: %d hits, %d misses, hit rate %.2f' % (
+            stats['hits'], stats['misses'], hit_rate)
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import json
+import time
+import contextlib
+
+
+class Tracer(object):
+    """Spans of the search loop in Chrome's trace event format.
+
+    Every span becomes a complete ('X') event on a named track, such as
+    'master' for the phases of an iteration or a proxy for the cells it
+    ran. flush() appends the events to trace_path, a JSON array left
+    open so that later iterations only ever append; chrome://tracing
+    and Perfetto load it as is.
+
+    summary() totals the time of each phase since the last summary. Only
+    spans of cat 'phase' count, so a span nested in a phase needs another
+    category for the totals to add up to the iteration.
+    """
+
+    def __init__(self, trace_path=None, process_name=None):
+        self.trace_path = trace_path
+        self.pid = os.getpid()
+        self.events = []
+        self.tracks = {}
+        self.phase_totals = {}
+        self.phase_order = []
+
+        if process_name is None:
+            process_name = 'proxy_master %d' % self.pid
+        self.events.append({'ph': 'M', 'name': 'process_name',
+                            'pid': self.pid, 'args': {'name': process_name}})
+
+    def track(self, name):
+        if name not in self.tracks:
+            self.tracks[name] = len(self.tracks)
+            self.events.append({'ph': 'M', 'name': 'thread_name',
+                                'pid': self.pid, 'tid': self.tracks[name],
+                                'args': {'name': name}})
+        return self.tracks[name]
+
+    def complete(self, name, start_ts, end_ts, track='master', cat='phase',
+                 args=None):
+        event = {'ph': 'X', 'name': name, 'cat': cat, 'pid': self.pid,
+                 'tid': self.track(track), 'ts': int(start_ts * 1e6),
+                 'dur': int(max(0, end_ts - start_ts) * 1e6)}
+        if args:
+            event['args'] = args
+        self.events.append(event)
+
+        if cat == 'phase':
+            if name not in self.phase_totals:
+                self.phase_totals[name] = 0.0
+                self.phase_order.append(name)
+            self.phase_totals[name] += end_ts - start_ts
+
+    @contextlib.contextmanager
+    def span(self, name, track='master', cat='phase', **args):
+        start_ts = time.time()
+        try:
+            yield
+        finally:
+            self.complete(name, start_ts, time.time(), track, cat, args)
+
+    def job(self, name, job, cat, **args):
+        # a finished Job of remote_exec, on the track of its host
+        self.complete(name, job.start_ts, job.end_ts or time.time(),
+                      track=job.host, cat=cat, args=args)
+
+    def summary(self):
+        totals = [(name, self.phase_totals[name])
+                  for name in self.phase_order]
+        self.phase_totals = {}
+        self.phase_order = []
+        return totals
+
+    def flush(self):
+        if self.trace_path is None or not self.events:
+            return
+
+        new_file = not os.path.isfile(self.trace_path)
+        lines = [json.dumps(event) + ',\n' for event in self.events]
+        with open(self.trace_path, 'a') as trace_file:
+            if new_file:
+                trace_file.write('[\n')
+            trace_file.writelines(lines)
+        self.events = []
+
+
+def format_summary(totals):
+    return 'time per phase: ' + ', '.join(
+        '%s %.2fs' % (name, seconds) for name, seconds in totals)
+
+
+def main():
+    # print the phase totals of every iteration in a trace file
+    with open(sys.argv[1]) as trace_file:
+        text = trace_file.read().rstrip().rstrip(',')
+    if not text.endswith(']'):
+        text += ']'
+
+    for event in json.loads(text):
+        if event.get('name') == 'iteration' and event['ph'] == 'X':
+            sys.stdout.write('%s %.2fs: %s\n' % (
+                event['args'].get('job_id'), event['dur'] / 1e6,
+                format_summary(event['args']['phases'])))
+
+
+if __name__ == '__main__':
+    main()